@@ -0,0 +1,109 @@
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .ingest import ingest_settings
+
+DEFAULTS = {
+    'VIEWS': {},
+    'INGEST_VIEWS': [],
+    'PER_USER_SLOTS': 2,
+    'GLOBAL_SLOTS': 16,
+    'MAX_INPUT_BYTES': 10 * 1024 * 1024,
+    'SLOT_TIMEOUT': 120,
+    'QUEUE_WAIT': 2.0,
+    'RETRY_AFTER': 5,
+    'CACHE_ALIAS': 'default',
+}
+# Room for the other form fields next to an upload
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+def admission_settings():
+    return {**DEFAULTS, **getattr(settings, 'ANALYSIS_ADMISSION', {})}
+
+
+#Largest request body a view accepts: upload views are bounded by main.ingest instead of MAX_INPUT_BYTES
+def input_limit(config, url_name):
+    if url_name in config['INGEST_VIEWS']:
+        return ingest_settings()['MAX_UPLOAD_BYTES'] + FORM_OVERHEAD_BYTES
+    return config['MAX_INPUT_BYTES']
+
+
+#Keep the request's slots while long work runs, so they do not expire under it; call it regularly
+def renew_admission(request):
+    admission = getattr(request, '_admission', None)
+    if admission is not None:
+        admission.renew()
+
+
+class SlotPool:
+    # Counting semaphore over cache.add(), which is atomic on shared backends.
+    # Slots expire after SLOT_TIMEOUT so a crashed worker cannot leak them.
+
+    def __init__(self, config=None):
+        self.config = config or admission_settings()
+        self.cache = caches[self.config['CACHE_ALIAS']]
+
+    def try_acquire(self, prefix, limit, token):
+        slots = list(range(limit))
+        random.shuffle(slots)
+        for slot in slots:
+            key = f"admission:{prefix}:{slot}"
+            if self.cache.add(key, token, self.config['SLOT_TIMEOUT']):
+                return key
+        return None
+
+    def release(self, key, token):
+        if self.cache.get(key) == token:
+            self.cache.delete(key)
+
+    #Extend a held slot, or take it back if it expired and is still free
+    def renew(self, key, token):
+        if self.cache.get(key) == token:
+            return self.cache.touch(key, self.config['SLOT_TIMEOUT'])
+        return self.cache.add(key, token, self.config['SLOT_TIMEOUT'])
+
+    #Take a per-user and a global slot, waiting up to QUEUE_WAIT seconds for both
+    def acquire(self, user_key):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.config['QUEUE_WAIT']
+
+        while True:
+            user_slot = self.try_acquire(f"user:{user_key}", self.config['PER_USER_SLOTS'], token)
+            if user_slot:
+                global_slot = self.try_acquire('global', self.config['GLOBAL_SLOTS'], token)
+                if global_slot:
+                    return Admission(self, token, [user_slot, global_slot])
+                self.release(user_slot, token)
+
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(random.uniform(0.05, 0.2))
+
+
+class Admission:
+    def __init__(self, pool, token, keys):
+        self.pool = pool
+        self.token = token
+        self.keys = keys
+        self.released = False
+        self.renewed_at = time.monotonic()
+
+    #At most a few times per SLOT_TIMEOUT, however often it is called
+    def renew(self):
+        now = time.monotonic()
+        if self.released or now - self.renewed_at < self.pool.config['SLOT_TIMEOUT'] / 3:
+            return
+        self.renewed_at = now
+        for key in self.keys:
+            self.pool.renew(key, self.token)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            for key in self.keys:
+                self.pool.release(key, self.token)
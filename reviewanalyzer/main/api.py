@@ -0,0 +1,250 @@
+import base64
+import json
+from datetime import datetime
+from functools import wraps
+
+from django.core.exceptions import RequestDataTooBig
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+
+from .caching import bump_data_version
+from .lexicon import get_analyzer
+from .models import AnalysisResult
+from .word_index import index_analysis
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#Every stored field except the owner, in model order
+API_FIELDS = tuple(
+    field.name for field in AnalysisResult._meta.concrete_fields if field.name != 'user'
+)
+#Lists default to the scores only; word lists and texts are the bulk of a row
+LIST_FIELDS = (
+    'id', 'product_name', 'created_at', 'overall_sentiment', 'sentiment_score',
+    'total_words', 'positive_words', 'negative_words', 'neutral_words', 'aspects',
+)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_BULK_IDS = 1000
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def loads(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), content_type='application/json', status=status)
+
+
+def error_response(status, message):
+    response = json_response({'error': message}, status=status)
+    if status == 401:
+        response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+#Token-authenticated JSON view: CSRF-exempt, gzip-compressed when the client accepts it, errors as JSON.
+#ApiTokenMiddleware only accepts tokens for views carrying the api_view mark.
+def api_view(methods):
+    def decorator(view):
+        @csrf_exempt
+        @gzip_page
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = error_response(405, f'Method {request.method} not allowed')
+                response['Allow'] = ', '.join(methods)
+                return response
+            if getattr(request, 'api_token', None) is None:
+                return error_response(401, 'Send a valid API token as "Authorization: Token <key>"')
+            try:
+                return view(request, *args, **kwargs)
+            except ApiError as e:
+                return error_response(e.status, e.message)
+        wrapper.api_view = True
+        return wrapper
+    return decorator
+
+
+def request_json(request):
+    try:
+        data = loads(request.body or b'{}')
+    except RequestDataTooBig:
+        raise ApiError(413, 'Request body too large')
+    except ValueError:
+        raise ApiError(400, 'Request body is not valid JSON')
+    if not isinstance(data, dict):
+        raise ApiError(400, 'Request body must be a JSON object')
+    return data
+
+
+#Requested fields as a comma-separated string or a JSON list; id is always included
+def parse_fields(value, default):
+    if not value:
+        return list(default)
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list):
+        raise ApiError(400, 'fields must be a list of field names')
+
+    fields = ['id']
+    for field in value:
+        field = str(field).strip()
+        if field and field not in fields:
+            fields.append(field)
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown:
+        raise ApiError(400, f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def serialize(row):
+    if isinstance(row.get('created_at'), datetime):
+        row['created_at'] = row['created_at'].isoformat()
+    return row
+
+
+def parse_ids(value):
+    if isinstance(value, str):
+        value = [part for part in value.split(',') if part.strip()]
+    if not isinstance(value, list) or not value:
+        raise ApiError(400, 'ids must be a non-empty list of analysis ids')
+    if len(value) > MAX_BULK_IDS:
+        raise ApiError(400, f'At most {MAX_BULK_IDS} ids per request')
+    try:
+        return list(dict.fromkeys(int(analysis_id) for analysis_id in value))
+    except (TypeError, ValueError):
+        raise ApiError(400, 'ids must be integers')
+
+
+#Opaque keyset cursor: the (created_at, id) of the last row of the previous page
+def encode_cursor(created_at, analysis_id):
+    return base64.urlsafe_b64encode(dumps([created_at.isoformat(), analysis_id])).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, analysis_id = loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(analysis_id)
+    except (TypeError, ValueError):
+        raise ApiError(400, 'Invalid cursor')
+
+
+def list_analyses(request):
+    fields = parse_fields(request.GET.get('fields'), LIST_FIELDS)
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ApiError(400, 'limit must be an integer')
+
+    analyses = AnalysisResult.objects.filter(user=request.user)
+    if request.GET.get('sentiment'):
+        analyses = analyses.filter(overall_sentiment=request.GET['sentiment'])
+    if request.GET.get('product'):
+        analyses = analyses.filter(product_name=request.GET['product'])
+    if request.GET.get('cursor'):
+        created_at, analysis_id = decode_cursor(request.GET['cursor'])
+        analyses = analyses.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=analysis_id))
+
+    # Seeks on the (user, created_at) index instead of counting and skipping rows like OFFSET
+    rows = list(
+        analyses.order_by('-created_at', '-id')
+        .values(*dict.fromkeys(fields + ['created_at']))[:limit + 1]
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    if 'created_at' not in fields:
+        for row in rows:
+            del row['created_at']
+
+    return json_response({'results': [serialize(row) for row in rows], 'next_cursor': next_cursor})
+
+
+def submit_analysis(request):
+    data = request_json(request)
+    product_name = data.get('product_name')
+    review_text = data.get('review_text')
+    if not isinstance(product_name, str) or not product_name.strip():
+        raise ApiError(400, 'product_name is required')
+    if len(product_name) > 255:
+        raise ApiError(400, 'product_name is longer than 255 characters')
+    if not isinstance(review_text, str) or not review_text.strip():
+        raise ApiError(400, 'review_text is required')
+    fields = parse_fields(data.get('fields'), API_FIELDS)
+    save = data.get('save', True)
+    if not isinstance(save, bool):
+        raise ApiError(400, 'save must be true or false')
+
+    analyzer = get_analyzer()
+    analysis = AnalysisResult.from_analysis(
+        request.user, product_name, review_text, analyzer.comprehensive_analysis(review_text)
+    )
+    if save:
+        with transaction.atomic():
+            analysis.save()
+            index_analysis(analysis)
+            bump_data_version(request.user)
+
+    return json_response(
+        serialize({field: getattr(analysis, field) for field in fields}), status=201 if save else 200
+    )
+
+
+@api_view(['GET', 'POST'])
+def analyses(request):
+    if request.method == 'POST':
+        return submit_analysis(request)
+    return list_analyses(request)
+
+
+@api_view(['GET'])
+def analysis_detail(request, analysis_id):
+    fields = parse_fields(request.GET.get('fields'), API_FIELDS)
+    row = AnalysisResult.objects.filter(user=request.user, pk=analysis_id).values(*fields).first()
+    if row is None:
+        raise ApiError(404, 'Analysis not found')
+    return json_response(serialize(row))
+
+
+#Many analyses in one query: GET ?ids=1,2,3 or POST {"ids": [...], "fields": [...]}
+@api_view(['GET', 'POST'])
+def analyses_bulk(request):
+    if request.method == 'POST':
+        data = request_json(request)
+        ids = parse_ids(data.get('ids'))
+        fields = parse_fields(data.get('fields'), API_FIELDS)
+    else:
+        ids = parse_ids(request.GET.get('ids', ''))
+        fields = parse_fields(request.GET.get('fields'), API_FIELDS)
+
+    rows = {
+        row['id']: serialize(row)
+        for row in AnalysisResult.objects.filter(user=request.user, id__in=ids).values(*fields)
+    }
+    return json_response({
+        'results': [rows[analysis_id] for analysis_id in ids if analysis_id in rows],
+        'missing': [analysis_id for analysis_id in ids if analysis_id not in rows],
+    })
@@ -0,0 +1,111 @@
+import hashlib
+import os
+from functools import lru_cache, wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import UserDataVersion
+
+FRAGMENT_CACHE_TIMEOUT = 300
+BUILD_FILES = ('.py', '.html')
+
+
+#Per-user data version, read once per request
+def get_data_version(request):
+    if not hasattr(request, '_data_version'):
+        row = UserDataVersion.objects.filter(user=request.user).values_list('version', 'updated_at').first()
+        request._data_version = row or (0, None)
+    return request._data_version
+
+
+def bump_data_version(user):
+    updated = UserDataVersion.objects.filter(user=user).update(version=F('version') + 1, updated_at=timezone.now())
+    if not updated:
+        # In a savepoint: callers save inside transaction.atomic(), which a bare IntegrityError
+        # would leave unusable for the update below
+        try:
+            with transaction.atomic():
+                UserDataVersion.objects.create(user=user, version=1)
+        except IntegrityError:
+            UserDataVersion.objects.filter(user=user).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+#After bulk changes that touch many users, e.g. archived partitions
+def bump_data_versions(user_ids):
+    user_ids = set(user_ids)
+    UserDataVersion.objects.filter(user_id__in=user_ids).update(version=F('version') + 1, updated_at=timezone.now())
+    existing = set(UserDataVersion.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+    UserDataVersion.objects.bulk_create(
+        [UserDataVersion(user_id=user_id, version=1) for user_id in user_ids - existing], ignore_conflicts=True
+    )
+
+
+#Changes with every deploy, so pages built by older templates or code are not served from caches or as 304s:
+#settings.BUILD_VERSION when set (the same on every server), else a hash of the template and app file mtimes
+@lru_cache(maxsize=None)
+def build_version():
+    if getattr(settings, 'BUILD_VERSION', ''):
+        return settings.BUILD_VERSION
+    roots = [str(path) for template in settings.TEMPLATES for path in template.get('DIRS', [])]
+    roots.append(apps.get_app_config('main').path)
+    digest = hashlib.sha1()
+    for root in sorted(set(roots)):
+        for path, dirs, files in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__' and not d.startswith('.'))
+            for name in sorted(files):
+                if name.endswith(BUILD_FILES):
+                    file_path = os.path.join(path, name)
+                    digest.update(f"{file_path}:{os.stat(file_path).st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+
+#Pages embed a CSRF token, so cached copies are only valid for the same CSRF secret
+def fragment_version(request):
+    version, _ = get_data_version(request)
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    csrf_hash = hashlib.sha1(csrf_cookie.encode()).hexdigest()[:12]
+    return f"{build_version()}-{request.user.pk}-{version}-{csrf_hash}"
+
+
+def has_pending_messages(request):
+    return bool(request.COOKIES.get('messages')) or '_messages' in request.session
+
+
+def data_etag(request, *args, **kwargs):
+    if not request.user.is_authenticated or has_pending_messages(request):
+        return None
+    return fragment_version(request)
+
+
+def data_last_modified(request, *args, **kwargs):
+    if not request.user.is_authenticated or has_pending_messages(request):
+        return None
+    return get_data_version(request)[1]
+
+
+#ETag/Last-Modified from the user's data version, 304 when nothing changed
+def conditional_on_user_data(view):
+    conditional_view = condition(etag_func=data_etag, last_modified_func=data_last_modified)(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = conditional_view(request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    return wrapper
+
+
+#Cache a computed value (e.g. page statistics) under the user's data version
+def cached_for_user(request, name, compute, timeout=FRAGMENT_CACHE_TIMEOUT):
+    version, _ = get_data_version(request)
+    key = f"user-data:{build_version()}:{request.user.pk}:{version}:{hashlib.md5(name.encode()).hexdigest()}"
+    return cache.get_or_set(key, compute, timeout)
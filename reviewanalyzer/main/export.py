@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+EXPORT_COLUMNS = [
+    'id', 'product_name', 'review_text', 'created_at',
+    'overall_sentiment', 'sentiment_score',
+    'total_words', 'positive_words', 'negative_words', 'neutral_words', 'intensifiers', 'negations',
+    'positive_percentage', 'negative_percentage', 'neutral_percentage',
+    'positive_summary', 'negative_summary', 'neutral_summary',
+    'positive_words_list', 'negative_words_list', 'neutral_words_list', 'intensifiers_list', 'negations_list',
+    'aspects',
+]
+
+DEFAULT_EXPORT_COLUMNS = [
+    'id', 'product_name', 'created_at', 'overall_sentiment', 'sentiment_score',
+    'total_words', 'positive_words', 'negative_words', 'neutral_words',
+]
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+
+def parse_columns(value):
+    if not value:
+        return list(DEFAULT_EXPORT_COLUMNS)
+    if value == 'all':
+        return list(EXPORT_COLUMNS)
+
+    columns = [column.strip() for column in value.split(',') if column.strip()]
+    unknown = [column for column in columns if column not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown export columns: {', '.join(unknown)}")
+    return columns
+
+
+def to_plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_csv_lines(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for row in rows:
+        writer.writerow([
+            json.dumps(value) if isinstance(value, (list, dict)) else to_plain(value)
+            for value in row
+        ])
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def iter_jsonl_lines(rows, columns):
+    lines = []
+    size = 0
+
+    for row in rows:
+        line = json.dumps(dict(zip(columns, map(to_plain, row))), ensure_ascii=False)
+        lines.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            lines.append('')
+            yield '\n'.join(lines)
+            lines = []
+            size = 0
+
+    if lines:
+        lines.append('')
+        yield '\n'.join(lines)
+
+
+#gzip on the fly, wbits=31 writes the gzip header and trailer
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+#Rows are read with a server-side cursor where supported, so memory stays flat
+def export_stream(queryset, columns, fmt='csv', compress=False, chunk_size=CHUNK_SIZE):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    rows = queryset.values_list(*columns).iterator(chunk_size=chunk_size)
+    lines = iter_csv_lines(rows, columns) if fmt == 'csv' else iter_jsonl_lines(rows, columns)
+    chunks = (text.encode('utf-8') for text in lines if text)
+
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_filename(fmt, compress=False):
+    return f"analyses.{fmt}.gz" if compress else f"analyses.{fmt}"
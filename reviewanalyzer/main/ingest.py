@@ -0,0 +1,242 @@
+import csv
+import gzip
+import io
+import json
+import os
+import zipfile
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import AnalysisResult
+from .word_index import index_analyses
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+
+RECORD_FORMATS = ('.csv', '.jsonl', '.ndjson')
+TEXT_FORMATS = ('.txt',)
+TEXT_COLUMNS = ('review_text', 'review', 'text', 'body', 'content', 'comment')
+
+BATCH_SIZE = 200
+
+DEFAULTS = {
+    'MAX_UPLOAD_BYTES': 32 * 1024 * 1024,
+    'MAX_TEXT_BYTES': 16 * 1024 * 1024,
+    'MAX_DECOMPRESSED_BYTES': 32 * 1024 * 1024,
+}
+READ_ERRORS = (UnicodeDecodeError, csv.Error, zipfile.BadZipFile, gzip.BadGzipFile, EOFError)
+
+
+class IngestError(Exception):
+    pass
+
+
+def ingest_settings():
+    return {**DEFAULTS, **getattr(settings, 'REVIEW_INGEST', {})}
+
+
+def record_format(name):
+    ext = os.path.splitext(name.lower())[1]
+    if ext in RECORD_FORMATS:
+        return 'csv' if ext == '.csv' else 'jsonl'
+    if ext in TEXT_FORMATS:
+        return 'txt'
+    raise IngestError(f"Unsupported file type: {name}")
+
+
+def megabytes(limit):
+    return f"{limit / (1024 * 1024):g} MB"
+
+
+#Decompressed bytes of one upload. Raises IngestError once more than limit bytes came out, so a small
+#archive cannot expand without bound; used carries the count over from the previous zip member.
+class LimitedReader(io.RawIOBase):
+    def __init__(self, stream, limit, used=0):
+        self.stream = stream
+        self.limit = limit
+        self.count = used
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # Never decompresses more than one byte past the limit
+        data = self.stream.read(min(len(buffer), self.limit - self.count + 1))
+        self.count += len(data)
+        if self.count > self.limit:
+            raise IngestError(f"The upload expands to more than {megabytes(self.limit)} once decompressed")
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def text_stream(binary):
+    # utf-8-sig drops the BOM that spreadsheet exports like to add
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+#Yield (format, text stream) for every document in the upload, decompressing lazily and at most
+#REVIEW_INGEST['MAX_DECOMPRESSED_BYTES'] in total
+def open_documents(uploaded_file):
+    name = uploaded_file.name or ''
+    magic = uploaded_file.read(4)
+    uploaded_file.seek(0)
+    limit = ingest_settings()['MAX_DECOMPRESSED_BYTES']
+
+    if magic.startswith(GZIP_MAGIC):
+        inner_name = name[:-3] if name.lower().endswith('.gz') else name
+        reader = LimitedReader(gzip.GzipFile(fileobj=uploaded_file, mode='rb'), limit)
+        yield record_format(inner_name), text_stream(io.BufferedReader(reader))
+
+    elif magic.startswith(ZIP_MAGIC):
+        used = 0
+        with zipfile.ZipFile(uploaded_file) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or os.path.basename(info.filename).startswith('.'):
+                    continue
+                with archive.open(info) as member:
+                    reader = LimitedReader(member, limit, used)
+                    yield record_format(info.filename), text_stream(io.BufferedReader(reader))
+                    used = reader.count
+
+    else:
+        yield record_format(name), text_stream(uploaded_file)
+
+
+def is_multi_record(uploaded_file):
+    name = (uploaded_file.name or '').lower()
+    if name.endswith('.zip'):
+        return True
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return os.path.splitext(name)[1] in RECORD_FORMATS
+
+
+def pick_column(columns, requested):
+    if requested:
+        if requested not in columns:
+            raise IngestError(f"Column '{requested}' not found")
+        return requested
+    for column in TEXT_COLUMNS:
+        if column in columns:
+            return column
+    raise IngestError(f"No review text column found, expected one of: {', '.join(TEXT_COLUMNS)}")
+
+
+#A whole text document, refused when it holds more than max_bytes
+def read_text(stream, max_bytes):
+    # Characters are at least a byte each, so this never reads much past the limit
+    text = stream.read(max_bytes + 1)
+    if len(text) > max_bytes and len(text.encode()) > max_bytes:
+        raise IngestError(f"The review text is longer than {megabytes(max_bytes)}")
+    return text
+
+
+#Yield (product, review text) pairs one row at a time; no text document or JSON line may be
+#longer than REVIEW_INGEST['MAX_TEXT_BYTES']
+def iter_records(fmt, stream, text_column=None, product_column=None):
+    max_text_bytes = ingest_settings()['MAX_TEXT_BYTES']
+    if fmt == 'txt':
+        yield None, read_text(stream, max_text_bytes)
+        return
+
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        column = pick_column(reader.fieldnames or [], text_column)
+        if product_column and product_column not in (reader.fieldnames or []):
+            raise IngestError(f"Column '{product_column}' not found")
+        for row in reader:
+            yield (row.get(product_column) if product_column else None), row.get(column)
+        return
+
+    column = None
+    for line_number, line in enumerate(iter(lambda: stream.readline(max_text_bytes + 1), ''), start=1):
+        if len(line) > max_text_bytes and not line.endswith('\n'):
+            raise IngestError(f"Line {line_number} is longer than {megabytes(max_text_bytes)}")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            raise IngestError(f"Invalid JSON on line {line_number}")
+        if not isinstance(row, dict):
+            raise IngestError(f"Expected a JSON object on line {line_number}")
+        if column is None:
+            column = pick_column(row.keys(), text_column)
+        product = row.get(product_column) if product_column else None
+        yield (str(product) if product is not None else None), row.get(column)
+
+
+def read_single_review(uploaded_file):
+    for fmt, stream in open_documents(uploaded_file):
+        if fmt != 'txt':
+            raise IngestError('Expected a plain text file')
+        return read_text(stream, ingest_settings()['MAX_TEXT_BYTES'])
+    raise IngestError('The uploaded archive is empty')
+
+
+def save_batch(batch):
+    with transaction.atomic():
+        AnalysisResult.objects.bulk_create(batch)
+        index_analyses(batch)
+
+
+#Analyze and save every row of a multi-record upload as its own review.
+#Runs inside the request, so the review text is capped at REVIEW_INGEST['MAX_TEXT_BYTES'];
+#on_batch is called after every saved batch.
+def ingest_upload(user, uploaded_file, analyzer, default_product, text_column=None, product_column=None,
+                  on_batch=None):
+    config = ingest_settings()
+    if uploaded_file.size is not None and uploaded_file.size > config['MAX_UPLOAD_BYTES']:
+        raise IngestError(f"Uploads are limited to {megabytes(config['MAX_UPLOAD_BYTES'])}")
+
+    max_text_bytes = config['MAX_TEXT_BYTES']
+    sentiments_by_product = defaultdict(Counter)
+    skipped = 0
+    text_bytes = 0
+    batch = []
+    error = None
+
+    try:
+        for fmt, stream in open_documents(uploaded_file):
+            for product, text in iter_records(fmt, stream, text_column, product_column):
+                if not isinstance(text, str) or not text.strip():
+                    skipped += 1
+                    continue
+
+                text_bytes += len(text.encode())
+                if text_bytes > max_text_bytes:
+                    raise IngestError(
+                        f"The upload holds more than {megabytes(max_text_bytes)} of review text; "
+                        f"the reviews before that were saved, split the rest into smaller files"
+                    )
+
+                product = (product or '').strip()[:255] or default_product
+                analysis = analyzer.comprehensive_analysis(text)
+                batch.append(AnalysisResult.from_analysis(user, product, text, analysis))
+                sentiments_by_product[product][analysis['overview']['sentiment']] += 1
+
+                if len(batch) >= BATCH_SIZE:
+                    # Taken off first, so a batch whose save failed is not saved again below
+                    pending, batch = batch, []
+                    save_batch(pending)
+                    if on_batch is not None:
+                        on_batch()
+    except READ_ERRORS as e:
+        error = IngestError(f"Error reading file: {e}")
+    except IngestError as e:
+        error = e
+
+    # Rows analyzed before a bad row or a read error are kept; database errors propagate before this
+    if batch:
+        save_batch(batch)
+    if error is not None:
+        raise error
+
+    return {
+        'total': sum(sum(counts.values()) for counts in sentiments_by_product.values()),
+        'skipped': skipped,
+        'by_product': {product: dict(counts) for product, counts in sentiments_by_product.items()},
+    }
@@ -0,0 +1,125 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .models import LexiconCandidate
+from utilities.languages import MultilingualAnalyzer
+from utilities.sentiment import SentimentAnalyzer
+from utilities.word_stats import UnknownWordCollector
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'WIDTH': 2 ** 14,
+    'DEPTH': 4,
+    'TOP_K': 500,
+    'FLUSH_EVERY': 1000,
+    'FLUSH_SECONDS': 300,
+    'MAX_QUEUED_TOKENS': 1000000,
+    'BATCH_SIZE': 64,
+}
+
+LANGUAGE_DEFAULTS = {
+    'ENABLED': False,
+    'ROUTE': 'review',
+    'DEFAULT_LANGUAGE': 'en',
+    'MAX_LOADED': 3,
+}
+
+_collector = None
+_collector_lock = threading.Lock()
+
+
+def collector_settings():
+    return {**DEFAULTS, **getattr(settings, 'LEXICON_COLLECTOR', {})}
+
+
+def language_settings():
+    return {**LANGUAGE_DEFAULTS, **getattr(settings, 'SENTIMENT_LANGUAGES', {})}
+
+
+#MultilingualAnalyzer options, or None when SENTIMENT_LANGUAGES is disabled and route is not forced
+def language_options(route=None):
+    config = language_settings()
+    if not (config['ENABLED'] or route):
+        return None
+    return {
+        'route': route or config['ROUTE'],
+        'default_language': config['DEFAULT_LANGUAGE'],
+        'max_loaded': config['MAX_LOADED'],
+    }
+
+
+#Analyzer for views and commands: routed by language when SENTIMENT_LANGUAGES['ENABLED']
+def get_analyzer():
+    options = language_options()
+    if options is None:
+        return SentimentAnalyzer(collector=get_collector())
+    return MultilingualAnalyzer(collector=get_collector(), **options)
+
+
+#Add a flushed window of heavy hitters to the stored counts
+def save_candidates(candidates):
+    now = timezone.now()
+    by_kind = {}
+    for kind, term, count in candidates:
+        by_kind.setdefault(kind, {})[term] = count
+
+    try:
+        with transaction.atomic():
+            for kind, counts in by_kind.items():
+                existing = list(
+                    LexiconCandidate.objects.select_for_update().filter(kind=kind, text__in=list(counts))
+                )
+                for candidate in existing:
+                    candidate.count += counts.pop(candidate.text)
+                    candidate.last_seen = now
+                LexiconCandidate.objects.bulk_update(existing, ['count', 'last_seen'])
+                LexiconCandidate.objects.bulk_create(
+                    [
+                        LexiconCandidate(kind=kind, text=term, count=count, first_seen=now, last_seen=now)
+                        for term, count in counts.items()
+                    ],
+                    ignore_conflicts=True,
+                )
+    except DatabaseError:
+        # Candidate counts are best effort
+        logger.exception('Could not save lexicon candidates')
+    finally:
+        # Flushes run on the collector's own thread, which would otherwise keep its connection open
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+#Process-wide collector, None unless LEXICON_COLLECTOR['ENABLED']
+def get_collector():
+    global _collector
+    if _collector is None:
+        config = collector_settings()
+        if not config['ENABLED']:
+            return None
+        with _collector_lock:
+            if _collector is None:
+                _collector = UnknownWordCollector(
+                    width=config['WIDTH'],
+                    depth=config['DEPTH'],
+                    top_k=config['TOP_K'],
+                    flush_every=config['FLUSH_EVERY'],
+                    flush_seconds=config['FLUSH_SECONDS'],
+                    max_queued_tokens=config['MAX_QUEUED_TOKENS'],
+                    batch_size=config['BATCH_SIZE'],
+                    on_flush=save_candidates,
+                )
+                atexit.register(flush_collector)
+    return _collector
+
+
+def flush_collector():
+    if _collector is None:
+        return []
+    return _collector.flush()
@@ -0,0 +1,422 @@
+import asyncio
+import html
+import json
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlencode, urljoin, urlsplit
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+HIDDEN_INPUT = re.compile(r'<input type="hidden" name="([^"]+)" value="([^"]*)"')
+JSON_SCRIPT = '<script id="{}" type="application/json">(.*?)</script>'
+WORD_LISTS = {
+    'positive_words_list': 'positiveWordsData',
+    'negative_words_list': 'negativeWordsData',
+    'neutral_words_list': 'neutralWordsData',
+    'intensifiers_list': 'intensifiersData',
+    'negations_list': 'negationsData',
+}
+
+POSITIVE_WORDS = ['good', 'excellent', 'love', 'happy', 'perfect', 'amazing', 'reliable', 'comfortable', 'fast']
+NEGATIVE_WORDS = ['bad', 'terrible', 'broken', 'slow', 'poor', 'disappointing', 'awful', 'cheap', 'noisy']
+ASPECTS = ['battery', 'delivery', 'quality', 'support', 'price', 'design', 'screen', 'packaging']
+FILLER = ['the', 'was', 'really', 'not', 'very', 'and', 'but', 'after', 'a', 'week', 'overall', 'it', 'is']
+#Seconds a user waits after a connection error, doubled on each one in a row
+BACKOFF_START = 0.1
+BACKOFF_MAX = 5.0
+
+
+#Deterministic review text of about size bytes
+def review_text(size, rng):
+    sentences = []
+    length = 0
+    while length < size:
+        words = [rng.choice(FILLER), rng.choice(ASPECTS), rng.choice(FILLER),
+                 rng.choice(POSITIVE_WORDS if rng.random() < 0.6 else NEGATIVE_WORDS)]
+        words += rng.sample(FILLER, 3)
+        sentence = ' '.join(words).capitalize() + rng.choice(['.', '.', '!', '?']) + ' '
+        sentences.append(sentence)
+        length += len(sentence)
+    return ''.join(sentences)[:size]
+
+
+def review_csv(size, rng):
+    lines = ['product,review_text']
+    length = len(lines[0])
+    while length < size:
+        line = f"{rng.choice(['Phone', 'Laptop', 'Headphones'])},\"{review_text(rng.randint(80, 400), rng)}\""
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, (filename, content, content_type) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', errors='replace')
+
+    @property
+    def location(self):
+        return self.headers.get('location')
+
+
+#Minimal HTTP/1.1 client on asyncio streams: one keep-alive connection and a cookie jar per virtual user
+class HttpClient:
+    def __init__(self, base_url, timeout=60):
+        parts = urlsplit(base_url)
+        if parts.scheme != 'http':
+            raise ValueError('Only http:// targets are supported')
+        self.base_url = base_url.rstrip('/')
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.cookies = {}
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', content_type=None, headers=None):
+        return await asyncio.wait_for(self._request(method, path, body, content_type, headers), self.timeout)
+
+    async def _request(self, method, path, body, content_type, headers):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        lines = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            f'Content-Length: {len(body)}',
+            'Accept-Encoding: identity',
+            f'Referer: {self.base_url}{path}',
+        ]
+        if content_type:
+            lines.append(f'Content-Type: {content_type}')
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{name}={value}' for name, value in self.cookies.items()))
+        for name, value in (headers or {}).items():
+            lines.append(f'{name}: {value}')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        status = int(status_line.split()[1])
+
+        response_headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name == 'set-cookie':
+                cookie, _, attributes = value.partition(';')
+                cookie_name, _, cookie_value = cookie.partition('=')
+                if cookie_value and 'max-age=0' not in attributes.lower():
+                    self.cookies[cookie_name.strip()] = cookie_value.strip().strip('"')
+                else:
+                    self.cookies.pop(cookie_name.strip(), None)
+            response_headers[name] = value
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            response_body = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            response_body = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            response_body = await self.reader.read()
+            response_headers['connection'] = 'close'
+
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+
+        return Response(status, response_headers, response_body)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, endpoint, seconds, status=None, error=False):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][str(status) if status else 'error'] += 1
+        if error:
+            self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[endpoint] = {
+                'requests': len(values),
+                'errors': self.errors[endpoint],
+                'statuses': dict(self.statuses[endpoint]),
+                'throughput_rps': round(len(values) / elapsed, 2) if elapsed else None,
+                'mean_ms': round(sum(values) / len(values) * 1000, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+                'max_ms': round(values[-1] * 1000, 2),
+            }
+        total = sum(len(values) for values in self.latencies.values())
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'throughput_rps': round(total / elapsed, 2) if elapsed else None,
+            'endpoints': endpoints,
+        }
+
+
+#Save form fields the live result page fills in with JavaScript, built from its event stream
+def fields_from_events(events):
+    fields = {}
+    overview = events.get('overview', {})
+    fields['overview_sentiment'] = overview.get('sentiment', 'neutral')
+    fields['overview_score'] = overview.get('score', 0)
+
+    metrics = events.get('metrics', {})
+    counts = metrics.get('word_counts', {})
+    fields['total_words'] = metrics.get('total_words', 0)
+    for key in ('positive', 'negative', 'neutral'):
+        fields[f'{key}_words'] = counts.get(key, 0)
+        fields[f'{key}_percentage'] = metrics.get('percentages', {}).get(key, 0)
+        fields[f'{key}_summary'] = '|||'.join(events.get(f'summary_{key}', []))
+    fields['intensifiers'] = counts.get('intensifiers', 0)
+    fields['negations'] = counts.get('negations', 0)
+
+    words = events.get('word_analysis', {})
+    for key in ('positive_words', 'negative_words', 'neutral_words', 'intensifiers', 'negations'):
+        fields[f'{key}_list'] = json.dumps(words.get(key, []))
+    fields['aspects'] = json.dumps({
+        aspect: [values['score'], values['mentions']] for aspect, values in events.get('aspects', {}).items()
+    })
+    return fields
+
+
+def parse_events(body):
+    events = {}
+    for block in body.split('\n\n'):
+        name = None
+        data = []
+        for line in block.splitlines():
+            if line.startswith('event:'):
+                name = line[6:].strip()
+            elif line.startswith('data:'):
+                data.append(line[5:].strip())
+        if name and data:
+            events[name] = json.loads('\n'.join(data))
+    return events
+
+
+class VirtualUser:
+    def __init__(self, client, recorder, config, index):
+        self.client = client
+        self.recorder = recorder
+        self.config = config
+        self.username = f"{config['user_prefix']}{index}"
+        self.rng = random.Random(config['seed'] + index)
+
+    async def call(self, endpoint, method, path, fields=None, files=None):
+        if files:
+            body, content_type = multipart(fields or {}, files)
+        elif fields is not None:
+            body, content_type = urlencode(fields).encode(), 'application/x-www-form-urlencoded'
+        else:
+            body, content_type = b'', None
+
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, body, content_type)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            self.recorder.add(endpoint, time.perf_counter() - started, error=True)
+            await self.client.close()
+            raise ConnectionFailed(f'{endpoint}: {e!r}')
+
+        self.recorder.add(endpoint, time.perf_counter() - started, response.status, response.status >= 400)
+        return response
+
+    async def form_token(self, endpoint, path):
+        response = await self.call(endpoint, 'GET', path)
+        match = CSRF_INPUT.search(response.text)
+        if not match:
+            raise RequestFailed(f'{endpoint}: no CSRF token on {path} (status {response.status})')
+        return match.group(1)
+
+    def path(self, response):
+        return urlsplit(urljoin(self.client.base_url + '/', response.location)).path
+
+    async def signup_and_login(self):
+        password = 'loadtest-' + uuid.uuid4().hex
+        token = await self.form_token('signup_form', '/signup/')
+        await self.call('signup', 'POST', '/signup/', {
+            'csrfmiddlewaretoken': token,
+            'username': self.username,
+            'email': f'{self.username}@loadtest.invalid',
+            'password': password,
+            'password1': password,
+        })
+        token = await self.form_token('login_form', '/login/')
+        response = await self.call('login', 'POST', '/login/', {
+            'csrfmiddlewaretoken': token, 'username': self.username, 'password': password,
+        })
+        if response.status != 302 or 'dashboard' not in (response.location or ''):
+            raise RequestFailed(f'login failed for {self.username} (status {response.status})')
+
+    #Follow the analyze redirect to the result page and save it like the browser would
+    async def result_and_save(self, response, product_name, review_text, token):
+        if response.status != 302:
+            return
+        path = self.path(response)
+
+        if path.startswith('/result/live'):
+            await self.call('result_live', 'GET', path)
+            stream = await self.call('result_stream', 'GET', '/result/stream/')
+            fields = fields_from_events(parse_events(stream.text))
+            fields.update({'product_name': product_name, 'review_text': review_text})
+        elif path.startswith('/result'):
+            result = await self.call('result', 'GET', path)
+            if result.status != 200:
+                return
+            fields = {name: html.unescape(value) for name, value in HIDDEN_INPUT.findall(result.text)}
+            # The page script copies the first json_script block of each list into the form
+            for name, element_id in WORD_LISTS.items():
+                match = re.search(JSON_SCRIPT.format(element_id), result.text, re.S)
+                fields[name] = match.group(1) if match else '[]'
+        else:
+            return
+
+        fields['csrfmiddlewaretoken'] = token
+        await self.call('save_analysis', 'POST', '/save-analysis/', fields)
+
+    async def iteration(self):
+        token = await self.form_token('analyze_form', '/analyze/')
+
+        size = self.rng.choice(self.config['text_sizes'])
+        text = review_text(size, self.rng)
+        product_name = f'Load test {size}B'
+        response = await self.call('analyze_text', 'POST', '/analyze/', {
+            'csrfmiddlewaretoken': token, 'product_name': product_name, 'review_text': text,
+        })
+        await self.result_and_save(response, product_name, text, token)
+
+        if self.config['file_sizes']:
+            size = self.rng.choice(self.config['file_sizes'])
+            product_name = f'Load test file {size}B'
+            if self.config['file_format'] == 'csv':
+                content, filename, content_type = review_csv(size, self.rng), 'reviews.csv', 'text/csv'
+            else:
+                content, filename, content_type = review_text(size, self.rng), 'review.txt', 'text/plain'
+            response = await self.call(
+                f"analyze_file_{self.config['file_format']}", 'POST', '/analyze/',
+                {'csrfmiddlewaretoken': token, 'product_name': product_name},
+                {'review_file': (filename, content.encode(), content_type)},
+            )
+            if self.config['file_format'] == 'txt':
+                await self.result_and_save(response, product_name, content, token)
+
+        await self.call('dashboard', 'GET', '/dashboard/')
+        await self.call('history', 'GET', '/history/')
+
+    async def run(self, deadline, iterations):
+        try:
+            await self.signup_and_login()
+            done = 0
+            backoff = 0
+            while (deadline and time.monotonic() < deadline) or (not deadline and done < iterations):
+                try:
+                    await self.iteration()
+                    backoff = 0
+                except ConnectionFailed:
+                    # A refused connection fails at once; without a pause a --duration run against a
+                    # server that is down would spin and report thousands of errors per second
+                    backoff = min(BACKOFF_MAX, backoff * 2 or BACKOFF_START)
+                    await self.pause(backoff, deadline)
+                except RequestFailed:
+                    pass
+                done += 1
+        except RequestFailed:
+            pass
+        finally:
+            await self.client.close()
+
+    #Jittered, so users that failed together do not all reconnect at the same moment
+    async def pause(self, seconds, deadline):
+        seconds *= random.uniform(0.5, 1.0)
+        if deadline:
+            seconds = min(seconds, deadline - time.monotonic())
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+
+class RequestFailed(Exception):
+    pass
+
+
+#The server could not be reached, or dropped the connection
+class ConnectionFailed(RequestFailed):
+    pass
+
+
+async def run_load(base_url, config):
+    recorder = Recorder()
+    deadline = time.monotonic() + config['duration'] if config['duration'] else None
+    users = [
+        VirtualUser(HttpClient(base_url, config['timeout']), recorder, config, index)
+        for index in range(config['users'])
+    ]
+
+    started = time.monotonic()
+    await asyncio.gather(*(user.run(deadline, config['iterations']) for user in users))
+    return recorder.report(time.monotonic() - started)
@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = 'Create, list or revoke API tokens for the JSON API under /api/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default='', help='Label for a new token')
+        parser.add_argument('--list', action='store_true', help="List the user's tokens")
+        parser.add_argument('--revoke', metavar='PREFIX', help='Delete the token whose key starts with PREFIX')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} not found")
+
+        if options['list']:
+            for token in user.api_tokens.order_by('created_at'):
+                last_used = token.last_used_at.isoformat(timespec='seconds') if token.last_used_at else 'never'
+                self.stdout.write(f'{token.prefix}  {token.name or "-":<20}  last used {last_used}')
+            return
+
+        if options['revoke']:
+            deleted, _ = user.api_tokens.filter(prefix=options['revoke'][:8]).delete()
+            if not deleted:
+                raise CommandError(f"No token starting with {options['revoke']}")
+            self.stdout.write(self.style.SUCCESS(f'Revoked {deleted} token(s)'))
+            return
+
+        token, key = ApiToken.create_token(user, options['name'])
+        self.stderr.write(f'Created token {token.prefix} for {user.username}; the key is not shown again:')
+        self.stdout.write(key)
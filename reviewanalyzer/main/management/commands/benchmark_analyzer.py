@@ -0,0 +1,104 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from utilities.sentiment import SentimentAnalyzer
+
+FILLER = ['the', 'it', 'was', 'and', 'but', 'after', 'a', 'week', 'my', 'this', 'is', 'for', 'with', 'i', 'of']
+INFLECTIONS = ['s', 'ed', 'ing', 'ly', 'er', 'est', 'ness']
+
+
+#Reviews mixing filler, lexicon words and inflected lexicon words that only match after normalization
+def synthetic_reviews(analyzer, count, seed):
+    rng = random.Random(seed)
+    lexicon = sorted(analyzer.positive_words | analyzer.negative_words | analyzer.aspects)
+    reviews = []
+    for _ in range(count):
+        words = []
+        for _ in range(rng.randint(10, 120)):
+            roll = rng.random()
+            if roll < 0.7:
+                words.append(rng.choice(FILLER))
+            elif roll < 0.95:
+                words.append(rng.choice(lexicon))
+            else:
+                words.append(rng.choice(lexicon) + rng.choice(INFLECTIONS))
+            if rng.random() < 0.08:
+                words[-1] += '.'
+        reviews.append(' '.join(words))
+    return reviews
+
+
+class Command(BaseCommand):
+    help = 'Compare analyze_sentiment throughput with exact lexicon matching and with suffix normalization'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='One review per line (default: synthetic reviews)')
+        parser.add_argument('--reviews', type=int, default=5000, help='Synthetic reviews to generate')
+        parser.add_argument('--repeat', type=int, default=15, help='Timed passes per mode; the median is reported')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        exact = SentimentAnalyzer(normalize=False)
+        normalized = SentimentAnalyzer()
+        if normalized.lemmatizer is None:
+            raise CommandError(f'No suffixes.txt in {normalized.data_dir}, nothing to compare')
+
+        if options['file']:
+            with open(options['file'], 'r', encoding='utf-8', errors='replace') as f:
+                reviews = [line.strip() for line in f if line.strip()]
+        else:
+            reviews = synthetic_reviews(exact, options['reviews'], options['seed'])
+        if not reviews:
+            raise CommandError('No reviews to score')
+        megabytes = sum(len(review.encode()) for review in reviews) / (1024 * 1024)
+
+        # The first normalized pass fills the lemma cache; every later pass only hits it
+        normalized.lemmatizer.lemma.cache_clear()
+        started = time.perf_counter()
+        for review in reviews:
+            normalized.analyze_sentiment(review)
+        cold = time.perf_counter() - started
+
+        # One untimed pass of exact matching too, so neither mode is timed with cold caches
+        for review in reviews:
+            exact.analyze_sentiment(review)
+
+        timings = {'exact': [], 'normalized': []}
+        for _ in range(max(1, options['repeat'])):
+            # Alternated, so both modes see the same machine load
+            for name, analyzer in (('exact', exact), ('normalized', normalized)):
+                # CPU time of this process, so time spent descheduled on a busy machine is not counted
+                started = time.process_time()
+                for review in reviews:
+                    analyzer.analyze_sentiment(review)
+                timings[name].append(time.process_time() - started)
+        # The median, since a single lucky or unlucky pass moves the best or the mean by several percent
+        median = {name: statistics.median(times) for name, times in timings.items()}
+        # Each pass's ratio, as both modes of a pass ran back to back under the same load
+        ratios = [e / n for e, n in zip(timings['exact'], timings['normalized'])]
+
+        hits = {
+            name: sum(len(analyzer.analyze_sentiment(review)[2].hits) for review in reviews)
+            for name, analyzer in (('exact', exact), ('normalized', normalized))
+        }
+
+        self.stdout.write(f'{len(reviews)} reviews, {megabytes:.2f} MB, median of {len(ratios)} passes')
+        for name in ('exact', 'normalized'):
+            self.stdout.write(
+                f'{name:<11} {len(reviews) / median[name]:>10.0f} reviews/s {megabytes / median[name]:>8.2f} MB/s '
+                f'{hits[name]:>9} lexicon hits'
+            )
+        self.stdout.write(f'{"cold cache":<11} {len(reviews) / cold:>10.0f} reviews/s (first normalized pass)')
+        self.stdout.write(
+            f'normalized throughput is {statistics.median(ratios):.1%} of exact matching '
+            f'(passes ranged {min(ratios):.1%} to {max(ratios):.1%})'
+        )
+
+        info = normalized.lemmatizer.cache_info()
+        self.stdout.write(
+            f'lemma cache: {info.currsize} distinct tokens, {info.hits} hits, {info.misses} misses '
+            f'({info.hits / max(1, info.hits + info.misses):.1%} hit rate)'
+        )
@@ -0,0 +1,64 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.caching import bump_data_versions
+from main.lexicon import get_analyzer
+from main.models import AnalysisResult, compact_aspects
+from main.word_index import index_analyses
+
+
+class Command(BaseCommand):
+    help = 'Backfill the word occurrence and aspect score index from saved analyses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only index analyses of this username')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--rescore-aspects', action='store_true',
+                            help='Re-run the analyzer to fill in aspect scores, e.g. for analyses saved before they existed')
+
+    def handle(self, *args, **options):
+        fields = ['id', 'user_id', 'positive_words_list', 'negative_words_list', 'aspects']
+        if options['rescore_aspects']:
+            fields.append('review_text')
+            analyzer = get_analyzer()
+        else:
+            analyzer = None
+        analyses = AnalysisResult.objects.order_by('id').only(*fields)
+
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} not found")
+            analyses = analyses.filter(user=user)
+
+        batch_size = options['batch_size']
+        batch = []
+        indexed = occurrences = 0
+
+        for analysis in analyses.iterator(chunk_size=batch_size):
+            batch.append(analysis)
+            if len(batch) >= batch_size:
+                occurrences += self.index_batch(batch, analyzer)
+                indexed += len(batch)
+                batch = []
+
+        if batch:
+            occurrences += self.index_batch(batch, analyzer)
+            indexed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} analyses ({occurrences} word occurrences)'))
+
+
+    #Word and aspect views of these users change, so their cached pages and ETags must too
+    def index_batch(self, batch, analyzer):
+        if analyzer is not None:
+            self.rescore_aspects(batch, analyzer)
+        occurrences = index_analyses(batch)
+        bump_data_versions(analysis.user_id for analysis in batch)
+        return occurrences
+
+    def rescore_aspects(self, batch, analyzer):
+        for analysis in batch:
+            analysis.aspects = compact_aspects(analyzer.analyze_sentiment(analysis.review_text)[2].aspects)
+        AnalysisResult.objects.bulk_update(batch, ['aspects'])
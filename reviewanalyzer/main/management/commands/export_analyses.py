@@ -0,0 +1,59 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.export import CHUNK_SIZE, EXPORT_FORMATS, export_stream, parse_columns
+from main.models import AnalysisResult
+from main.search import filter_analyses
+
+
+class Command(BaseCommand):
+    help = 'Stream saved analyses as CSV or JSONL, optionally gzip-compressed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only export analyses of this username')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--columns', help="Comma-separated column names, or 'all'")
+        parser.add_argument('--sentiment', choices=['positive', 'negative', 'neutral'])
+        parser.add_argument('--date-from', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--date-to', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--output', '-o', help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            columns = parse_columns(options['columns'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        analyses = AnalysisResult.objects.order_by('id')
+        if options['user']:
+            try:
+                analyses = analyses.filter(user=User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} not found")
+
+        analyses = filter_analyses(
+            analyses,
+            sentiment=options['sentiment'],
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+        )
+
+        chunks = export_stream(
+            analyses, columns,
+            fmt=options['format'],
+            compress=options['gzip'],
+            chunk_size=options['chunk_size'],
+        )
+
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
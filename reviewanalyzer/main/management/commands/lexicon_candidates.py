@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from main.models import LexiconCandidate
+from utilities.sentiment import SentimentAnalyzer
+
+
+class Command(BaseCommand):
+    help = 'Report frequent words and bigrams that are missing from the sentiment lexicon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['word', 'bigram'], help='Only report words or bigrams')
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--min-count', type=int, default=2)
+        parser.add_argument('--include-known', action='store_true',
+                            help='Also list terms that have been added to the lexicon since they were counted')
+        parser.add_argument('--reset', action='store_true', help='Delete all collected candidates')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = LexiconCandidate.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} candidates'))
+            return
+
+        candidates = LexiconCandidate.objects.filter(count__gte=options['min_count']).order_by('-count', 'text')
+        if options['kind']:
+            candidates = candidates.filter(kind=options['kind'])
+
+        analyzer = SentimentAnalyzer()
+        known = analyzer.vocabulary
+        # Inflected forms of lexicon words are matched through their lemma, so they are known too
+        lemma = analyzer.lemmatizer.lemma if analyzer.lemmatizer else (lambda word: word)
+
+        reported = 0
+        for candidate in candidates.iterator():
+            if not options['include_known'] and any(lemma(word) in known for word in candidate.text.split()):
+                continue
+            self.stdout.write(f'{candidate.count:>10}  {candidate.kind:<6}  {candidate.text}')
+            reported += 1
+            if reported >= options['limit']:
+                break
+
+        if not reported:
+            self.stdout.write('No candidates collected yet')
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import platform
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connection, connections
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+
+from main.loadtest import run_load
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+#Test databases for every alias (replicas mirror the primary's), destroyed afterwards, so an in-process
+#run never writes to the configured databases. SQLite test databases are temporary files rather than
+#memory, so each server thread opens its own connection as it would in production.
+@contextmanager
+def throwaway_databases():
+    with tempfile.TemporaryDirectory(prefix='loadtest-') as tmpdir:
+        for alias in connections:
+            test = connections[alias].settings_dict['TEST']
+            if connections[alias].vendor == 'sqlite' and not test.get('NAME') and not test.get('MIRROR'):
+                test['NAME'] = os.path.join(tmpdir, f'{alias}.sqlite3')
+
+        old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=[])
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+
+def sizes(value):
+    try:
+        return [int(size) for size in value.split(',') if size.strip()]
+    except ValueError:
+        raise CommandError(f'Sizes must be comma-separated byte counts, got {value!r}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the site with concurrent simulated users: signup, login, analyze (text and file uploads), '
+        'result, save, dashboard and history. Reports throughput and p50/p95/p99 latency per endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000 '
+                                          '(default: start one in this process on a free port)')
+        parser.add_argument('--users', type=int, default=10, help='Concurrent simulated users')
+        parser.add_argument('--iterations', type=int, default=5, help='Analyze/save/browse rounds per user')
+        parser.add_argument('--duration', type=float, help='Run for this many seconds instead of --iterations')
+        parser.add_argument('--text-bytes', type=sizes, default=[500, 5000, 25000],
+                            help='Comma-separated sizes of pasted reviews, one picked per round '
+                                 '(sizes from LIVE_RESULT_MIN_CHARS up use the live result stream)')
+        parser.add_argument('--file-bytes', type=sizes, default=[20000],
+                            help='Comma-separated sizes of uploaded files, empty to skip uploads')
+        parser.add_argument('--file-format', choices=['txt', 'csv'], default='txt',
+                            help='Upload one review (txt) or many reviews (csv)')
+        parser.add_argument('--timeout', type=float, default=120, help='Seconds before a request counts as failed')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', '-o', help='Write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('--users must be at least 1')
+
+        run_id = uuid.uuid4().hex[:8]
+        config = {
+            'users': options['users'],
+            'iterations': options['iterations'],
+            'duration': options['duration'],
+            'text_sizes': options['text_bytes'] or [500],
+            'file_sizes': options['file_bytes'],
+            'file_format': options['file_format'],
+            'timeout': options['timeout'],
+            'seed': options['seed'],
+            'user_prefix': f'loadtest-{run_id}-',
+        }
+
+        if options['url']:
+            report, started = self.run(options['url'], config)
+        else:
+            # The in-process server gets its own throwaway database, the configured one is never touched
+            with throwaway_databases():
+                report, started = self.run_in_process(config)
+
+        report = {
+            'config': {**config, 'url': options['url'] or 'in-process'},
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'started': started.isoformat(),
+            },
+            **report,
+        }
+
+        self.stdout.write(
+            f"{'endpoint':<22}{'requests':>9}{'errors':>8}{'req/s':>9}{'mean ms':>10}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        )
+        for endpoint, stats in report['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<22}{stats['requests']:>9}{stats['errors']:>8}{stats['throughput_rps']:>9}"
+                f"{stats['mean_ms']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                f"{stats['p99_ms']:>10}{stats['max_ms']:>10}"
+            )
+        self.stdout.write(
+            f"{report['requests']} requests, {report['errors']} errors in {report['elapsed_seconds']}s "
+            f"({report['throughput_rps']} req/s)"
+        )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stderr.write(f"Report written to {options['output']}")
+
+    def run(self, base_url, config):
+        self.stderr.write(
+            f"Load testing {base_url} with {config['users']} users, "
+            + (f"{config['duration']}s" if config['duration'] else f"{config['iterations']} iterations each")
+        )
+        started = timezone.now()
+        return asyncio.run(run_load(base_url, config)), started
+
+    def run_in_process(self, config):
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+        server.set_app(get_internal_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        # The server threads open their own connections
+        connection.close()
+        try:
+            return self.run(f'http://127.0.0.1:{server.server_address[1]}', config)
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,310 @@
+import csv
+import gzip
+import os
+import re
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from main.caching import bump_data_versions
+
+TABLE = 'analysis_results'
+LEGACY_TABLE = 'analysis_results_legacy'
+ARCHIVE_TABLE = 'analysis_results_archive'
+DEFAULT_PARTITION = 'analysis_results_default'
+MOVED_ROWS = 'analysis_results_moved'
+PARTITION_PATTERN = re.compile(r'^analysis_results_p(\d{4})(\d{2})$')
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+class Command(BaseCommand):
+    help = (
+        'Manage PostgreSQL range partitioning of analysis_results by created_at: '
+        'convert the existing table, create upcoming monthly partitions, archive old ones'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['convert', 'create', 'archive', 'status'])
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Monthly partitions to create beyond the current month')
+        parser.add_argument('--retain-months', type=int, default=12,
+                            help='archive: keep partitions that end within this many months')
+        parser.add_argument('--archive-dir',
+                            help='archive: write each old partition to a gzipped CSV file in this directory')
+        parser.add_argument('--archive-table', action='store_true',
+                            help=f'archive: move old partitions into the compressed {ARCHIVE_TABLE} table')
+        parser.add_argument('--keep-legacy', action='store_true',
+                            help=f'convert: keep the original table as {LEGACY_TABLE}')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning is only supported on PostgreSQL')
+
+        if options['action'] == 'convert':
+            self.convert(options)
+        elif options['action'] == 'create':
+            self.require_partitioned()
+            created = self.create_partitions(month_start(date.today()), options['months_ahead'])
+            self.stdout.write(self.style.SUCCESS(f'Created {created} partitions'))
+        elif options['action'] == 'archive':
+            self.require_partitioned()
+            self.archive(options)
+        else:
+            self.status()
+
+    def execute_sql(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def fetch(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    #Stored (non-generated) columns, quoted for use in SQL
+    def column_list(self, table):
+        columns = self.fetch(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_name = %s AND is_generated = 'NEVER' ORDER BY ordinal_position",
+            [table],
+        )
+        return ', '.join(f'"{column}"' for (column,) in columns)
+
+    def is_partitioned(self):
+        return bool(self.fetch(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [TABLE],
+        ))
+
+    def require_partitioned(self):
+        if not self.is_partitioned():
+            raise CommandError(f"{TABLE} is not partitioned yet, run 'partition_analyses convert' first")
+
+    def partitions(self):
+        rows = self.fetch(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s ORDER BY c.relname",
+            [TABLE],
+        )
+        return [row[0] for row in rows]
+
+    def create_partitions(self, first_month, months_ahead):
+        existing = set(self.partitions())
+        last_month = add_months(month_start(date.today()), months_ahead)
+        created = 0
+
+        month = first_month
+        while month <= last_month:
+            name = partition_name(month)
+            if name not in existing:
+                with transaction.atomic():
+                    moved = self.take_from_default(month) if DEFAULT_PARTITION in existing else None
+                    self.execute_sql(
+                        f"CREATE TABLE {name} PARTITION OF {TABLE} "
+                        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                    )
+                    if moved:
+                        self.execute_sql(f"INSERT INTO {TABLE} ({moved}) SELECT {moved} FROM {MOVED_ROWS}")
+                        self.execute_sql(f"DROP TABLE {MOVED_ROWS}")
+                created += 1
+            month = add_months(month, 1)
+
+        if DEFAULT_PARTITION not in existing:
+            self.execute_sql(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+
+        return created
+
+    #A new partition cannot be created while the default partition holds rows of its month (e.g. a
+    #created_at in the future), so they are taken out first and put back through the parent afterwards.
+    #Returns the moved columns, or None when there was nothing to move.
+    def take_from_default(self, month):
+        bounds = [month, add_months(month, 1)]
+        # Writes into the default partition wait until the new partition exists
+        self.execute_sql(f"LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE")
+        if not self.fetch(
+            f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s LIMIT 1", bounds
+        ):
+            return None
+
+        column_list = self.column_list(DEFAULT_PARTITION)
+        self.execute_sql(
+            f"CREATE TEMP TABLE {MOVED_ROWS} ON COMMIT DROP AS "
+            f"SELECT {column_list} FROM {DEFAULT_PARTITION} WITH NO DATA"
+        )
+        self.execute_sql(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s "
+            f"RETURNING {column_list}) INSERT INTO {MOVED_ROWS} ({column_list}) SELECT {column_list} FROM moved",
+            bounds,
+        )
+        self.stdout.write(f'Moving rows of {month:%Y-%m} out of {DEFAULT_PARTITION}')
+        return column_list
+
+    #Swap the plain table for a partitioned one with the same columns and indexes
+    @transaction.atomic
+    def convert(self, options):
+        if self.is_partitioned():
+            raise CommandError(f'{TABLE} is already partitioned')
+
+        self.execute_sql(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+
+        # Foreign keys cannot point at a partitioned table's id alone
+        for table, constraint in self.fetch(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = %s::regclass",
+            [TABLE],
+        ):
+            self.stdout.write(f'Dropping foreign key {constraint} on {table}')
+            self.execute_sql(f'ALTER TABLE {table} DROP CONSTRAINT {constraint}')
+
+        index_definitions = [
+            row[0] for row in self.fetch(
+                "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i "
+                "WHERE i.indrelid = %s::regclass AND NOT i.indisprimary",
+                [TABLE],
+            )
+        ]
+        column_list = self.column_list(TABLE)
+
+        self.execute_sql(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}")
+        self.execute_sql(
+            f"CREATE TABLE {TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING IDENTITY) "
+            f"PARTITION BY RANGE (created_at)"
+        )
+        # The partition key has to be part of the primary key
+        self.execute_sql(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, created_at)")
+        self.execute_sql(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_fk "
+            f"FOREIGN KEY (user_id) REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED"
+        )
+
+        oldest = self.fetch(f"SELECT min(created_at) FROM {LEGACY_TABLE}")[0][0]
+        first_month = month_start(oldest.date()) if oldest else month_start(date.today())
+        created = self.create_partitions(first_month, options['months_ahead'])
+
+        self.execute_sql(f"INSERT INTO {TABLE} ({column_list}) SELECT {column_list} FROM {LEGACY_TABLE}")
+        copied = self.fetch(f"SELECT count(*) FROM {TABLE}")[0][0]
+
+        # Keep id generation going from where the old table stopped
+        sequence = self.fetch("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])[0][0]
+        if sequence:
+            self.execute_sql(
+                f"SELECT setval('{sequence}', (SELECT coalesce(max(id), 0) + 1 FROM {TABLE}), false)"
+            )
+        else:
+            legacy_sequence = self.fetch("SELECT pg_get_serial_sequence(%s, 'id')", [LEGACY_TABLE])[0][0]
+            if legacy_sequence:
+                self.execute_sql(f"ALTER SEQUENCE {legacy_sequence} OWNED BY {TABLE}.id")
+
+        if options['keep_legacy']:
+            # Index names must be free for the new table
+            for (index_name,) in self.fetch(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s", [LEGACY_TABLE]
+            ):
+                self.execute_sql(f'ALTER INDEX "{index_name}" RENAME TO "legacy_{index_name[:50]}"')
+        else:
+            self.execute_sql(f"DROP TABLE {LEGACY_TABLE}")
+
+        # Created after the copy, which is much faster than maintaining them row by row
+        for definition in index_definitions:
+            self.execute_sql(definition)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Converted {TABLE}: {copied} rows in {created} monthly partitions plus {DEFAULT_PARTITION}'
+        ))
+
+    def expired_partitions(self, retain_months):
+        cutoff = add_months(month_start(date.today()), -retain_months)
+        expired = []
+        for name in self.partitions():
+            match = PARTITION_PATTERN.match(name)
+            if match:
+                month = date(int(match.group(1)), int(match.group(2)), 1)
+                if add_months(month, 1) <= cutoff:
+                    expired.append(name)
+        return expired
+
+    def archive(self, options):
+        if not options['archive_dir'] and not options['archive_table']:
+            raise CommandError('Choose where to archive to with --archive-dir or --archive-table')
+
+        if options['archive_table']:
+            self.ensure_archive_table()
+
+        for name in self.expired_partitions(options['retain_months']):
+            with transaction.atomic():
+                self.execute_sql(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+                user_ids = [row[0] for row in self.fetch(f"SELECT DISTINCT user_id FROM {name}")]
+                self.execute_sql(f"DELETE FROM word_occurrences WHERE analysis_id IN (SELECT id FROM {name})")
+                self.execute_sql(f"DELETE FROM aspect_scores WHERE analysis_id IN (SELECT id FROM {name})")
+
+                if options['archive_dir']:
+                    rows = self.write_archive_file(name, options['archive_dir'])
+                else:
+                    rows = self.move_to_archive_table(name)
+
+                self.execute_sql(f"DROP TABLE {name}")
+                # ETags and cached fragments of these users still describe the archived rows
+                bump_data_versions(user_ids)
+            self.stdout.write(f'Archived {name} ({rows} rows)')
+
+        self.stdout.write(self.style.SUCCESS('Archive complete'))
+
+    def ensure_archive_table(self):
+        self.execute_sql(
+            f"CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} "
+            f"(LIKE {TABLE} INCLUDING DEFAULTS) WITH (toast_tuple_target = 128)"
+        )
+        # The full-text column is not needed for archived rows
+        self.execute_sql(f"ALTER TABLE {ARCHIVE_TABLE} DROP COLUMN IF EXISTS search_vector")
+        if connection.pg_version >= 140000:
+            for column in ('review_text', 'positive_words_list', 'negative_words_list', 'neutral_words_list'):
+                self.execute_sql(f"ALTER TABLE {ARCHIVE_TABLE} ALTER COLUMN {column} SET COMPRESSION lz4")
+
+    def move_to_archive_table(self, name):
+        column_list = self.column_list(ARCHIVE_TABLE)
+        self.execute_sql(f"INSERT INTO {ARCHIVE_TABLE} ({column_list}) SELECT {column_list} FROM {name}")
+        return self.fetch(f"SELECT count(*) FROM {name}")[0][0]
+
+    def write_archive_file(self, name, archive_dir):
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(archive_dir, f'{name}.csv.gz')
+        rows = 0
+
+        # Server-side cursor, the partition is never loaded into memory at once
+        with connection.chunked_cursor() as cursor, gzip.open(path, 'wt', newline='', encoding='utf-8') as f:
+            cursor.execute(f"SELECT {self.column_list(name)} FROM {name}")
+            writer = csv.writer(f)
+            writer.writerow([column[0] for column in cursor.description])
+            while True:
+                batch = cursor.fetchmany(2000)
+                if not batch:
+                    break
+                writer.writerows(batch)
+                rows += len(batch)
+
+        return rows
+
+    def status(self):
+        if not self.is_partitioned():
+            self.stdout.write(f'{TABLE} is not partitioned')
+            return
+
+        for name in self.partitions():
+            count = self.fetch(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [name]
+            )[0][0]
+            self.stdout.write(f'{name}: ~{max(count, 0)} rows')
@@ -0,0 +1,130 @@
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.caching import bump_data_version
+from main.ingest import BATCH_SIZE, TEXT_COLUMNS, save_batch
+from main.lexicon import language_options
+from main.models import AnalysisResult
+from utilities.corpus import CHUNK_BYTES, RECORD_FORMATS, score_file_chunks
+from utilities.languages import ROUTES
+
+# Full analyses are much larger than the scores, so saving uses smaller chunks
+SAVE_CHUNK_MB = 1
+
+OUTPUT_FIELDS = ('offset', 'product', 'sentiment', 'score', 'total_words', 'positive', 'negative', 'aspects')
+
+
+class Command(BaseCommand):
+    help = (
+        'Score a review corpus on local disk through mmap, in parallel by byte range: '
+        'one review per line (lines/jsonl) or every sentence of one long text (sentences)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=RECORD_FORMATS,
+                            help='Record format (default: jsonl for .jsonl/.ndjson files, lines otherwise)')
+        parser.add_argument('--text-field', help='jsonl: field holding the review text')
+        parser.add_argument('--product-field', help='jsonl: field holding the product name')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes scoring chunks in parallel (1 scores in this process)')
+        parser.add_argument('--chunk-mb', type=float,
+                            help='Approximate chunk size, aligned to record boundaries '
+                                 f'(default: {CHUNK_BYTES // (1024 * 1024)}, or {SAVE_CHUNK_MB} with --save)')
+        parser.add_argument('--languages', choices=ROUTES,
+                            help='Score each review or each sentence with the lexicon of its detected language '
+                                 '(default: SENTIMENT_LANGUAGES in settings)')
+        parser.add_argument('--output', '-o', help="Write one JSON result per record to this file ('-' for stdout)")
+        parser.add_argument('--save', action='store_true', help='Save every review as an analysis of --user')
+        parser.add_argument('--user', help='--save: username that owns the analyses')
+        parser.add_argument('--product', help='--save: product name for records without one (default: file name)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'{path} is not a file')
+
+        record_format = options['format'] or (
+            'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'lines'
+        )
+
+        user = None
+        if options['save']:
+            if record_format == 'sentences':
+                raise CommandError('--save needs one review per record, use --format lines or jsonl')
+            if not options['user']:
+                raise CommandError('--save requires --user')
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} not found")
+        default_product = options['product'] or os.path.basename(path)[:255]
+
+        if options['output'] == '-':
+            output = sys.stdout
+        elif options['output']:
+            output = open(options['output'], 'w', encoding='utf-8')
+        else:
+            output = None
+
+        chunk_mb = options['chunk_mb'] or (SAVE_CHUNK_MB if options['save'] else CHUNK_BYTES / (1024 * 1024))
+        chunks = score_file_chunks(
+            path, record_format,
+            workers=options['workers'],
+            chunk_bytes=max(1, int(chunk_mb * 1024 * 1024)),
+            text_fields=(options['text_field'],) if options['text_field'] else TEXT_COLUMNS,
+            product_field=options['product_field'],
+            detail=options['save'],
+            languages=language_options(options['languages']),
+        )
+
+        sentiments = Counter()
+        score_total = 0.0
+        skipped = 0
+        batch = []
+        started = time.monotonic()
+
+        try:
+            for results, chunk_skipped in chunks:
+                skipped += chunk_skipped
+                for result in results:
+                    sentiments[result['sentiment']] += 1
+                    score_total += result['score']
+
+                    if output:
+                        output.write(json.dumps({field: result[field] for field in OUTPUT_FIELDS}) + '\n')
+
+                    if user:
+                        product = (result['product'] or '').strip()[:255] or default_product
+                        batch.append(AnalysisResult.from_analysis(user, product, result['text'], result['analysis']))
+                        if len(batch) >= BATCH_SIZE:
+                            # Taken off first, so a batch whose save failed is not saved again below
+                            pending, batch = batch, []
+                            save_batch(pending)
+        finally:
+            if batch:
+                save_batch(batch)
+            if user:
+                bump_data_version(user)
+            if output and output is not sys.stdout:
+                output.close()
+
+        total = sum(sentiments.values())
+        elapsed = time.monotonic() - started
+        megabytes = os.path.getsize(path) / (1024 * 1024)
+
+        self.stderr.write(
+            f"Scored {total} {'sentences' if record_format == 'sentences' else 'reviews'} "
+            f"({skipped} unreadable records skipped) in {elapsed:.1f}s, {megabytes / max(elapsed, 1e-9):.1f} MB/s"
+        )
+        if total:
+            self.stderr.write(
+                f"positive {sentiments['positive']}, negative {sentiments['negative']}, "
+                f"neutral {sentiments['neutral']}, average score {score_total / total:.4f}"
+            )
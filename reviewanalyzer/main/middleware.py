@@ -0,0 +1,157 @@
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from .admission import SlotPool, admission_settings, input_limit
+from .models import ApiToken
+from .routers import has_written, track_writes, use_replica
+
+PIN_SESSION_KEY = '_db_primary_until'
+TOKEN_SCHEMES = ('token', 'bearer')
+# last_used_at is only written when it is older than this, not on every request
+TOKEN_TOUCH_SECONDS = 60
+
+
+#Whether the request goes to a view marked by main.api.api_view
+def is_api_view(request):
+    try:
+        match = resolve(request.path_info, getattr(request, 'urlconf', None))
+    except Resolver404:
+        return False
+    return getattr(match.func, 'api_view', False)
+
+
+class ApiTokenMiddleware:
+    # Authenticates "Authorization: Token <key>" requests to main.api views only. Everywhere else the
+    # header is ignored, so a token never stands in for the session or skips a CSRF check.
+    # Runs in __call__ rather than process_view, so AdmissionControlMiddleware sees the token's user.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.api_token = None
+        scheme, _, key = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme.lower() in TOKEN_SCHEMES and key.strip() and is_api_view(request):
+            token = (
+                ApiToken.objects.select_related('user')
+                .filter(key_hash=ApiToken.hash_key(key.strip()), user__is_active=True)
+                .first()
+            )
+            if token is not None:
+                request.api_token = token
+                request.user = token.user
+
+                now = timezone.now()
+                if token.last_used_at is None or (now - token.last_used_at).total_seconds() > TOKEN_TOUCH_SECONDS:
+                    ApiToken.objects.filter(pk=token.pk).update(last_used_at=now)
+
+        return self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    # Sends reads of the analytics views to a replica, except shortly after the session wrote something
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Not reset after the response, so streamed responses keep reading from the replica
+        use_replica(False)
+        track_writes()
+        response = self.get_response(request)
+
+        # Only after a successful write to the analyses, so form errors and plain POSTs keep the replica.
+        # Token clients have no session to pin, and saving one would create a session row per request.
+        if (has_written() and response.status_code < 400 and hasattr(request, 'session')
+                and getattr(request, 'api_token', None) is None):
+            request.session[PIN_SESSION_KEY] = time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if url_name not in getattr(settings, 'REPLICA_READ_VIEWS', ()):
+            return None
+
+        pinned_until = request.session.get(PIN_SESSION_KEY, 0) if hasattr(request, 'session') else 0
+        use_replica(time.time() >= pinned_until)
+        return None
+
+
+class AdmissionControlMiddleware:
+    # Bounds concurrent CPU-heavy analyses per user and globally, see ANALYSIS_ADMISSION in settings.
+    # Listed before CsrfViewMiddleware, so an oversized or rejected request is answered before its body is parsed.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        too_large = self.check_size(request)
+        if too_large is not None:
+            return too_large
+
+        response = self.get_response(request)
+
+        admission = getattr(request, '_admission', None)
+        if admission is not None:
+            if response.streaming:
+                # Hold the slots until the stream has been fully sent or closed
+                response.streaming_content = self.release_after(response.streaming_content, admission)
+            else:
+                admission.release()
+
+        return response
+
+    def check_size(self, request):
+        content_length = request.META.get('CONTENT_LENGTH')
+        if not content_length or not content_length.isdigit():
+            return None
+        config = admission_settings()
+        content_length = int(content_length)
+        # Most requests are small; only those that could be over a limit pay for the URL lookup
+        if content_length <= min(input_limit(config, url_name) for url_name in (None, *config['INGEST_VIEWS'])):
+            return None
+
+        try:
+            url_name = resolve(request.path_info, getattr(request, 'urlconf', None)).url_name
+        except Resolver404:
+            return None
+        if request.method not in config['VIEWS'].get(url_name, ()):
+            return None
+
+        limit = input_limit(config, url_name)
+        if content_length > limit:
+            return HttpResponse(f"Input too large, the limit is {limit // (1024 * 1024)} MB", status=413)
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        config = admission_settings()
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if request.method not in config['VIEWS'].get(url_name, ()):
+            return None
+        if not request.user.is_authenticated:
+            return None
+
+        admission = SlotPool(config).acquire(request.user.pk)
+        if admission is None:
+            response = HttpResponse(
+                'Too many analyses in progress, please retry shortly.', status=429
+            )
+            response['Retry-After'] = str(config['RETRY_AFTER'])
+            return response
+
+        request._admission = admission
+        return None
+
+    def release_after(self, content, admission):
+        try:
+            for chunk in content:
+                # A stream can outlast SLOT_TIMEOUT; each chunk keeps its slots alive
+                admission.renew()
+                yield chunk
+        finally:
+            admission.release()
@@ -0,0 +1,89 @@
+from django.db import migrations
+
+# PostgreSQL: a generated tsvector column kept up to date by the database, with a GIN index.
+# review_text is capped because a single tsvector cannot exceed 1MB.
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE analysis_results ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(product_name, '')), 'A') ||
+        setweight(to_tsvector('english',
+            coalesce(positive_summary::text, '') || ' ' ||
+            coalesce(negative_summary::text, '') || ' ' ||
+            coalesce(neutral_summary::text, '')), 'B') ||
+        setweight(to_tsvector('english', left(coalesce(review_text, ''), 200000)), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX analysis_results_search_idx ON analysis_results USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS analysis_results_search_idx",
+    "ALTER TABLE analysis_results DROP COLUMN IF EXISTS search_vector",
+]
+
+# SQLite: an FTS5 shadow table keyed by the analysis id and maintained by triggers.
+SQLITE_FTS_VALUES = (
+    "new.id, new.product_name, new.review_text, "
+    "new.positive_summary || ' ' || new.negative_summary || ' ' || new.neutral_summary"
+)
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE analysis_results_fts USING fts5(
+        product_name, review_text, summaries, tokenize = 'porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER analysis_results_fts_insert AFTER INSERT ON analysis_results BEGIN
+        INSERT INTO analysis_results_fts(rowid, product_name, review_text, summaries)
+        VALUES ({SQLITE_FTS_VALUES});
+    END
+    """,
+    """
+    CREATE TRIGGER analysis_results_fts_delete AFTER DELETE ON analysis_results BEGIN
+        DELETE FROM analysis_results_fts WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER analysis_results_fts_update AFTER UPDATE OF
+        product_name, review_text, positive_summary, negative_summary, neutral_summary
+    ON analysis_results BEGIN
+        DELETE FROM analysis_results_fts WHERE rowid = old.id;
+        INSERT INTO analysis_results_fts(rowid, product_name, review_text, summaries)
+        VALUES ({SQLITE_FTS_VALUES});
+    END
+    """,
+    f"""
+    INSERT INTO analysis_results_fts(rowid, product_name, review_text, summaries)
+    SELECT {SQLITE_FTS_VALUES.replace('new.', '')} FROM analysis_results
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS analysis_results_fts_update",
+    "DROP TRIGGER IF EXISTS analysis_results_fts_delete",
+    "DROP TRIGGER IF EXISTS analysis_results_fts_insert",
+    "DROP TABLE IF EXISTS analysis_results_fts",
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_statements({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
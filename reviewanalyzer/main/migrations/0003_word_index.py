@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_analysis_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentimentWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'db_table': 'sentiment_words',
+            },
+        ),
+        migrations.CreateModel(
+            name='WordOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('polarity', models.CharField(choices=[('positive', 'Positive'), ('negative', 'Negative')], max_length=10)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='word_occurrences', to='main.analysisresult')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('word', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='main.sentimentword')),
+            ],
+            options={
+                'db_table': 'word_occurrences',
+                'indexes': [models.Index(fields=['user', 'polarity', 'word'], name='word_occurr_user_id_f1b9cc_idx'), models.Index(fields=['word', 'polarity'], name='word_occurr_word_id_fa726b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('analysis', 'word', 'polarity'), name='unique_word_occurrence')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_user_data_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='wordoccurrence',
+            name='analysis',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='word_occurrences', to='main.analysisresult'),
+        ),
+    ]
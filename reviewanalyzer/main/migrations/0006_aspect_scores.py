@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:44
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+search_index = import_module('main.migrations.0002_analysis_search_index')
+
+# SQLite applies AddField by rebuilding analysis_results, which drops the FTS triggers of 0002.
+# They are recreated afterwards and the FTS table is refilled from the rebuilt table.
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS analysis_results_fts_insert",
+    "DROP TRIGGER IF EXISTS analysis_results_fts_delete",
+    "DROP TRIGGER IF EXISTS analysis_results_fts_update",
+    *search_index.SQLITE_FORWARD[1:4],
+    "DELETE FROM analysis_results_fts",
+    search_index.SQLITE_FORWARD[4],
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_word_occurrence_without_fk_constraint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Unapplying the AddField below rebuilds the table again, so the triggers are restored after it too
+        migrations.RunPython(
+            migrations.RunPython.noop,
+            search_index.run_statements({'sqlite': SQLITE_TRIGGERS}),
+        ),
+        migrations.AddField(
+            model_name='analysisresult',
+            name='aspects',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(
+            search_index.run_statements({'sqlite': SQLITE_TRIGGERS}),
+            migrations.RunPython.noop,
+        ),
+        migrations.CreateModel(
+            name='AspectScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('mentions', models.PositiveIntegerField(default=1)),
+                ('analysis', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='aspect_scores', to='main.analysisresult')),
+                ('aspect', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aspect_scores', to='main.sentimentword')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'aspect_scores',
+                'indexes': [models.Index(fields=['user', 'aspect'], name='aspect_scor_user_id_e7f0d5_idx')],
+                'constraints': [models.UniqueConstraint(fields=('analysis', 'aspect'), name='unique_aspect_score')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_aspect_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LexiconCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('word', 'Word'), ('bigram', 'Bigram')], max_length=10)),
+                ('text', models.CharField(max_length=201)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'lexicon_candidates',
+                'indexes': [models.Index(fields=['kind', '-count'], name='lexicon_can_kind_b19bd5_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'text'), name='unique_lexicon_candidate')],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:01
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+search_index = import_module('main.migrations.0002_analysis_search_index')
+
+# SQLite stores JSONField values with non-ASCII characters escaped ("\u00e9"), so the summaries column
+# of analysis_results_fts is now filled from the decoded sentences instead of the JSON text.
+# PostgreSQL is unchanged: jsonb::text keeps the characters as they are.
+SQLITE_FTS_VALUES = (
+    "new.id, new.product_name, new.review_text, (SELECT group_concat(value, ' ') FROM ("
+    "SELECT value FROM json_each(new.positive_summary) UNION ALL "
+    "SELECT value FROM json_each(new.negative_summary) UNION ALL "
+    "SELECT value FROM json_each(new.neutral_summary)))"
+)
+
+
+#Replace the insert and update triggers and refill the FTS table with the given column values
+def sqlite_statements(values):
+    return [
+        "DROP TRIGGER IF EXISTS analysis_results_fts_insert",
+        "DROP TRIGGER IF EXISTS analysis_results_fts_update",
+        f"""
+        CREATE TRIGGER analysis_results_fts_insert AFTER INSERT ON analysis_results BEGIN
+            INSERT INTO analysis_results_fts(rowid, product_name, review_text, summaries)
+            VALUES ({values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER analysis_results_fts_update AFTER UPDATE OF
+            product_name, review_text, positive_summary, negative_summary, neutral_summary
+        ON analysis_results BEGIN
+            DELETE FROM analysis_results_fts WHERE rowid = old.id;
+            INSERT INTO analysis_results_fts(rowid, product_name, review_text, summaries)
+            VALUES ({values});
+        END
+        """,
+        "DELETE FROM analysis_results_fts",
+        f"""
+        INSERT INTO analysis_results_fts(rowid, product_name, review_text, summaries)
+        SELECT {values.replace('new.', '')} FROM analysis_results
+        """,
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_api_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisSearchIndex',
+            fields=[
+                ('analysis', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='main.analysisresult')),
+            ],
+            options={
+                'db_table': 'analysis_results_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(
+            search_index.run_statements({'sqlite': sqlite_statements(SQLITE_FTS_VALUES)}),
+            search_index.run_statements({'sqlite': sqlite_statements(search_index.SQLITE_FTS_VALUES)}),
+        ),
+    ]
@@ -1,3 +1,6 @@
+import hashlib
+import secrets
+
 from django.db import models
 
 # Create your models here.
@@ -5,6 +8,13 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+def compact_aspects(aspect_analysis):
+    return {
+        aspect: [values['score'], values['mentions']]
+        for aspect, values in aspect_analysis.items()
+    }
+
+
 class AnalysisResult(models.Model):
     SENTIMENT_CHOICES = [
         ('positive', 'Positive'),
@@ -47,6 +57,9 @@ class AnalysisResult(models.Model):
     intensifiers_list = models.JSONField(default=list) 
     negations_list = models.JSONField(default=list) 
     
+    # Aspect analysis, compact {aspect: [score, mentions]}
+    aspects = models.JSONField(default=dict)
+    
     class Meta:
         db_table = 'analysis_results'
         ordering = ['-created_at']
@@ -56,4 +69,180 @@ class AnalysisResult(models.Model):
         ]
     
     def __str__(self):
-        return f"{self.product_name} - {self.overall_sentiment} ({self.created_at.date()})"
\ No newline at end of file
+        return f"{self.product_name} - {self.overall_sentiment} ({self.created_at.date()})"
+
+    @classmethod
+    def from_analysis(cls, user, product_name, review_text, analysis):
+        # Build an unsaved result from SentimentAnalyzer.comprehensive_analysis output
+        overview = analysis['overview']
+        metrics = analysis['detailed_metrics']
+        summary = analysis['summary_by_sentiment']
+        words = analysis['word_analysis']
+
+        return cls(
+            user=user,
+            product_name=product_name,
+            review_text=review_text,
+            overall_sentiment=overview['sentiment'],
+            sentiment_score=overview['score'],
+            total_words=metrics['total_words'],
+            positive_words=metrics['word_counts']['positive'],
+            negative_words=metrics['word_counts']['negative'],
+            neutral_words=metrics['word_counts']['neutral'],
+            intensifiers=metrics['word_counts']['intensifiers'],
+            negations=metrics['word_counts']['negations'],
+            positive_percentage=metrics['percentages']['positive'],
+            negative_percentage=metrics['percentages']['negative'],
+            neutral_percentage=metrics['percentages']['neutral'],
+            positive_summary=summary['positive'],
+            negative_summary=summary['negative'],
+            neutral_summary=summary['neutral'],
+            positive_words_list=words['positive_words'],
+            negative_words_list=words['negative_words'],
+            neutral_words_list=words['neutral_words'],
+            intensifiers_list=words['intensifiers'],
+            negations_list=words['negations'],
+            aspects=compact_aspects(analysis['aspect_analysis']),
+        )
+
+class AnalysisSearchIndex(models.Model):
+    # The SQLite FTS5 table from migration 0002, kept up to date by triggers. Unmanaged and only
+    # joined by main.search on SQLite; there is no such table on PostgreSQL.
+    analysis = models.OneToOneField(
+        AnalysisResult, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        related_name='search_index', db_constraint=False
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'analysis_results_fts'
+
+
+class SentimentWord(models.Model):
+    text = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        db_table = 'sentiment_words'
+
+    def __str__(self):
+        return self.text
+
+
+class WordOccurrence(models.Model):
+    POLARITY_CHOICES = [
+        ('positive', 'Positive'),
+        ('negative', 'Negative'),
+    ]
+
+    word = models.ForeignKey(SentimentWord, on_delete=models.CASCADE, related_name='occurrences')
+    # No database-level constraint: a partitioned analysis_results has no unique key on id alone.
+    # Django still cascades deletes.
+    analysis = models.ForeignKey(
+        AnalysisResult, on_delete=models.CASCADE, related_name='word_occurrences', db_constraint=False
+    )
+    # Denormalized from the analysis so per-user aggregates never join analysis_results
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    polarity = models.CharField(max_length=10, choices=POLARITY_CHOICES)
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        db_table = 'word_occurrences'
+        constraints = [
+            models.UniqueConstraint(fields=['analysis', 'word', 'polarity'], name='unique_word_occurrence'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'polarity', 'word']),
+            models.Index(fields=['word', 'polarity']),
+        ]
+
+    def __str__(self):
+        return f"{self.word} ({self.polarity}) x{self.count}"
+
+
+class AspectScore(models.Model):
+    # One row per aspect per analysis, so per-aspect aggregates are index scans
+    aspect = models.ForeignKey(SentimentWord, on_delete=models.CASCADE, related_name='aspect_scores')
+    analysis = models.ForeignKey(
+        AnalysisResult, on_delete=models.CASCADE, related_name='aspect_scores', db_constraint=False
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    score = models.FloatField()
+    mentions = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        db_table = 'aspect_scores'
+        constraints = [
+            models.UniqueConstraint(fields=['analysis', 'aspect'], name='unique_aspect_score'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'aspect']),
+        ]
+
+    def __str__(self):
+        return f"{self.aspect}: {self.score} ({self.mentions} mentions)"
+
+
+class UserDataVersion(models.Model):
+    # Bumped whenever a user's saved analyses change; drives ETags and cache keys
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'user_data_versions'
+
+    def __str__(self):
+        return f"{self.user} v{self.version}"
+
+
+class LexiconCandidate(models.Model):
+    # Frequent words and bigrams that matched no lexicon set, flushed from main.lexicon
+    KIND_CHOICES = [
+        ('word', 'Word'),
+        ('bigram', 'Bigram'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    text = models.CharField(max_length=201)
+    count = models.PositiveBigIntegerField(default=0)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'lexicon_candidates'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'text'], name='unique_lexicon_candidate'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', '-count']),
+        ]
+
+    def __str__(self):
+        return f"{self.text} ({self.kind}) x{self.count}"
+
+
+class ApiToken(models.Model):
+    # Only a SHA-256 digest of the key is stored; the key itself is shown once when it is created
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_tokens')
+    name = models.CharField(max_length=100, blank=True)
+    prefix = models.CharField(max_length=8)
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'api_tokens'
+
+    def __str__(self):
+        return f"{self.user} {self.prefix}… ({self.name or 'unnamed'})"
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def create_token(cls, user, name=''):
+        # Returns (token, key)
+        key = secrets.token_urlsafe(32)
+        token = cls.objects.create(user=user, name=name, prefix=key[:8], key_hash=cls.hash_key(key))
+        return token, key
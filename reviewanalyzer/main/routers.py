@@ -0,0 +1,53 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Set per request by ReplicaRoutingMiddleware: the replica this request reads from, or None for the primary.
+# One replica per request, so a data version and the rows it describes come from the same database.
+_replica = ContextVar('replica', default=None)
+# Whether the request has written to the main app's tables
+_wrote = ContextVar('wrote', default=False)
+
+
+def use_replica(enabled):
+    replicas = replica_aliases() if enabled else []
+    _replica.set(random.choice(replicas) if replicas else None)
+
+
+def track_writes():
+    _wrote.set(False)
+
+
+def has_written():
+    return _wrote.get()
+
+
+def replica_aliases():
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if alias in settings.DATABASES]
+
+
+class ReplicaRouter:
+    route_app_labels = {'main'}
+
+    # UserDataVersion is read from the same database as the analyses: a lagging replica then serves an older
+    # version with matching older rows, so nothing stale is cached under a newer version
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        return _replica.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        # Always write to the primary, even for instances that were read from a replica
+        if model._meta.app_label in self.route_app_labels:
+            _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,63 @@
+import re
+from datetime import datetime, time, timedelta
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'analysis_results_fts'
+SENTIMENTS = ('positive', 'negative', 'neutral')
+
+
+#Filters shared by history, search and exports
+def filter_analyses(queryset, sentiment=None, date_from=None, date_to=None):
+    if sentiment in SENTIMENTS:
+        queryset = queryset.filter(overall_sentiment=sentiment)
+
+    #Plain range filters so the (user, created_at) index is used
+    start = parse_date(date_from) if date_from else None
+    if start:
+        queryset = queryset.filter(created_at__gte=timezone.make_aware(datetime.combine(start, time.min)))
+
+    end = parse_date(date_to) if date_to else None
+    if end:
+        queryset = queryset.filter(created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+
+    return queryset
+
+
+#Full-text search, ranked by relevance
+def search_analyses(queryset, query):
+    terms = re.findall(r'\w+', query or '')
+    if not terms:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        return queryset.filter(
+            RawSQL(f'"analysis_results"."search_vector" @@ {tsquery}', [query], output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f'ts_rank_cd("analysis_results"."search_vector", {tsquery})', [query], output_field=FloatField())
+        ).order_by('-rank', '-created_at')
+
+    if vendor == 'sqlite':
+        #Quote every term so user input never reaches the FTS5 query syntax
+        match = ' '.join('"%s"' % term.replace('"', '""') for term in terms)
+        #One join on rowid: FTS5 yields the matching rows with their bm25 rank, and the queryset's own
+        #filters (user, sentiment, dates) apply to the joined rows in the same pass
+        return queryset.filter(search_index__isnull=False).filter(
+            RawSQL(f'"{FTS_TABLE}" MATCH %s', [match], output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f'-bm25("{FTS_TABLE}", 10.0, 1.0, 4.0)', [], output_field=FloatField())
+        ).order_by('-rank', '-created_at')
+
+    #Unindexed fallback for other backends
+    condition = Q()
+    for term in terms:
+        condition &= Q(product_name__icontains=term) | Q(review_text__icontains=term)
+    return queryset.filter(condition).annotate(rank=Value(0.0, output_field=FloatField()))
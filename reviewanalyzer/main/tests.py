@@ -1,3 +1,808 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import weakref
+import zipfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import QuerySet
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from utilities.languages import LexiconShards, MultilingualAnalyzer
+from utilities.sentiment import SentimentAnalyzer
+from utilities.word_stats import UnknownWordCollector
+
+from . import ingest
+from .admission import SlotPool, admission_settings
+from .caching import bump_data_version, build_version, cached_for_user
+from .loadtest import Recorder, VirtualUser
+from .management.commands.partition_analyses import DEFAULT_PARTITION, month_start, partition_name
+from .middleware import PIN_SESSION_KEY
+from .models import AnalysisResult, ApiToken, UserDataVersion, WordOccurrence
+from .routers import ReplicaRouter, use_replica
+from .search import search_analyses
+from .word_index import index_analysis, top_words
+
+
+def save_review(user, product_name, review_text, analyzer=None):
+    analyzer = analyzer or SentimentAnalyzer()
+    analysis = AnalysisResult.from_analysis(
+        user, product_name, review_text, analyzer.comprehensive_analysis(review_text)
+    )
+    analysis.save()
+    return analysis
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reviewer', password='pw')
+
+    # Runs on the fully migrated test database, so it fails if a later migration drops the FTS triggers
+    def test_saved_analysis_is_found_after_all_migrations(self):
+        analysis = save_review(self.user, 'Trail Kettle', 'The kettle boils quickly and the handle stays cool.')
+        save_review(self.user, 'Desk Lamp', 'The lamp flickers.')
+
+        found = list(search_analyses(AnalysisResult.objects.filter(user=self.user), 'kettle'))
+        self.assertEqual([row.id for row in found], [analysis.id])
+
+    def test_edited_and_deleted_analyses_leave_the_index(self):
+        analysis = save_review(self.user, 'Trail Kettle', 'The kettle boils quickly.')
+        analysis.product_name = 'Camp Kettle'
+        analysis.save()
+        analyses = AnalysisResult.objects.filter(user=self.user)
+        self.assertFalse(search_analyses(analyses, 'trail').exists())
+        self.assertTrue(search_analyses(analyses, 'camp').exists())
+
+        analysis.delete()
+        self.assertFalse(search_analyses(analyses, 'kettle').exists())
+
+    # JSONField text is stored with non-ASCII characters escaped on SQLite
+    def test_summaries_are_indexed_as_text(self):
+        analysis = save_review(self.user, 'Kettle', 'Fine.')
+        analysis.positive_summary = ['Très bon café, açúcar incluído.']
+        analysis.save()
+        analyses = AnalysisResult.objects.filter(user=self.user)
+        self.assertTrue(search_analyses(analyses, 'café').exists())
+        self.assertTrue(search_analyses(analyses, 'açúcar').exists())
+        self.assertFalse(search_analyses(analyses, 'u00e9').exists())
+
+
+    def test_results_are_ranked_and_limited_to_the_user(self):
+        other = User.objects.create_user('other', password='pw')
+        save_review(other, 'Kettle Kettle', 'The kettle kettle kettle is fine.')
+        once = save_review(self.user, 'Desk Lamp', 'The lamp is fine, unlike my kettle.')
+        twice = save_review(self.user, 'Trail Kettle', 'The kettle boils quickly.')
+
+        found = list(search_analyses(AnalysisResult.objects.filter(user=self.user), 'kettle'))
+        self.assertEqual([row.id for row in found], [twice.id, once.id])
+        self.assertGreater(found[0].rank, found[1].rank)
+
+    def test_history_and_export_search(self):
+        save_review(self.user, 'Trail Kettle', 'The kettle boils quickly.')
+        save_review(self.user, 'Desk Lamp', 'The lamp flickers.')
+        self.client.force_login(self.user)
+
+        response = self.client.get('/history/', {'q': 'kettle'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_count'], 1)
+        self.assertEqual([row.product_name for row in response.context['analyses']], ['Trail Kettle'])
+
+        response = self.client.get('/history/export/', {'q': 'kettle', 'format': 'csv', 'columns': 'product_name'})
+        self.assertEqual(b''.join(response.streaming_content).decode().split(), ['product_name', 'Trail', 'Kettle'])
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('exporter', password='pw')
+        self.client.force_login(self.user)
+        for product in ('Kettle', 'Lamp', 'Café Grinder'):
+            save_review(self.user, product, f'The {product} is excellent.')
+
+    def export(self, **params):
+        response = self.client.get('/history/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response
+
+    def test_columns_are_selected(self):
+        response = self.export(format='jsonl', columns='product_name,overall_sentiment')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({tuple(row) for row in rows}, {('product_name', 'overall_sentiment')})
+        self.assertEqual({row['product_name'] for row in rows}, {'Kettle', 'Lamp', 'Café Grinder'})
+
+        response = self.client.get('/history/export/', {'columns': 'product_name,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_gzip_export_matches_the_plain_one(self):
+        plain = b''.join(self.export(format='csv', columns='all').streaming_content)
+        response = self.export(format='csv', columns='all', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('analyses.csv.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+        self.assertEqual(len(plain.decode().splitlines()), 4)
+
+    # Rows are flushed in pieces as they are read, not rendered into one body
+    def test_content_is_streamed_in_chunks(self):
+        with mock.patch('main.export.FLUSH_BYTES', 1):
+            chunks = list(self.export(format='csv', columns='product_name').streaming_content)
+        self.assertEqual([chunk.decode().split() for chunk in chunks], [['product_name', 'Café', 'Grinder'], ['Lamp'], ['Kettle']])
+
+    def test_filters_apply_to_the_export(self):
+        save_review(self.user, 'Toaster', 'The toaster is terrible.')
+        response = self.export(format='jsonl', columns='product_name', sentiment='negative')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(), ['{"product_name": "Toaster"}'])
+
+
+class AspectScoreTests(SimpleTestCase):
+    def setUp(self):
+        self.analyzer = SentimentAnalyzer()
+
+    def aspects(self, text):
+        return self.analyzer.analyze_sentiment(text)[2].aspects
+
+    # "support" and "quality" are positive words as well as aspects, and keep counting overall
+    def test_aspect_that_is_a_positive_word_does_not_score_itself(self):
+        sentiment, score, result = self.analyzer.analyze_sentiment('The support was terrible.')
+        self.assertEqual(result.aspects['support']['score'], -1.0)
+        self.assertEqual((sentiment, score), ('neutral', 0.0))
+
+    def test_aspects_leave_the_overall_score_unchanged(self):
+        sentiment, score, result = self.analyzer.analyze_sentiment(
+            'The support was useless and the return process was a nightmare.'
+        )
+        self.assertEqual((sentiment, score), ('positive', 0.3333))
+        self.assertEqual(result.aspects['support']['score'], -1.0)
+        self.assertEqual(result.aspects['return']['score'], -1.0)
+        self.assertEqual(self.analyzer.analyze_sentiment('Poor quality. The battery died after a week.')[:2], ('neutral', 0.0))
+
+    def test_hits_stay_in_their_sentence(self):
+        aspects = self.aspects('Poor quality. The battery died after a week.')
+        self.assertEqual(aspects['quality']['score'], -1.0)
+        self.assertEqual(aspects['battery']['score'], 0.0)
+        aspects = self.aspects('Excellent screen; the battery is small.')
+        self.assertEqual(aspects['screen']['score'], 1.0)
+        self.assertEqual(aspects['battery']['score'], 0.0)
+
+    def test_hits_before_and_after_an_aspect_count(self):
+        self.assertEqual(self.aspects('Excellent screen.')['screen']['score'], 1.0)
+        self.assertEqual(self.aspects('The screen is excellent.')['screen']['score'], 1.0)
+
+
+class ResultTests(SimpleTestCase):
+    # The nested dict analyze_sentiment returned before SentimentResult, less the unused processed_text
+    def test_to_dict_keeps_the_details_shape(self):
+        text = "The battery isn't very reliable, but the screen is excellent. Delivery was not bad, okay overall."
+        result = SentimentAnalyzer().analyze_sentiment(text)[2]
+        self.assertEqual(result.to_dict(), {
+            'sentiment': 'neutral',
+            'score': 0.0,
+            'percentages': {'positive': 11.76, 'negative': 5.88, 'neutral': 5.88},
+            'word_counts': {'total': 17, 'positive': 2, 'negative': 1, 'neutral': 1, 'intensifiers': 1, 'negations': 2},
+            'word_details': {
+                'positive_words': [
+                    {'word': 'excellent', 'position': 10, 'negated': False, 'intensity': 1.0, 'contributed_score': 1.0},
+                    {'word': 'bad', 'position': 14, 'negated': True, 'intensity': 1.0, 'contributed_score': 1.0},
+                ],
+                'negative_words': [
+                    {'word': 'reliable', 'position': 5, 'negated': True, 'intensity': 2.0, 'contributed_score': 2.0},
+                ],
+                'neutral_words': [
+                    {'word': 'okay', 'position': 15, 'negated': False, 'intensity': 1.0, 'contributed_score': 0},
+                ],
+                'intensifiers': [{'word': 'very', 'position': 4, 'multiplier': 2.0}],
+                'negations': [{'word': 'not', 'position': 3, 'active': True}, {'word': 'not', 'position': 13, 'active': True}],
+            },
+            'aspects': {
+                'battery': {'score': 0.0, 'mentions': 1},
+                'screen': {'score': -1.0, 'mentions': 1},
+                'delivery': {'score': 1.0, 'mentions': 1},
+            },
+        })
+        self.assertEqual(json.loads(json.dumps(result.to_dict())), result.to_dict())
+
+    def test_empty_text(self):
+        self.assertEqual(SentimentAnalyzer().analyze_sentiment('')[2].to_dict(), {
+            'sentiment': 'neutral',
+            'score': 0.0,
+            'percentages': {'positive': 0, 'negative': 0, 'neutral': 0},
+            'word_counts': {'total': 0, 'positive': 0, 'negative': 0, 'neutral': 0, 'intensifiers': 0, 'negations': 0},
+            'word_details': {
+                'positive_words': [], 'negative_words': [], 'neutral_words': [], 'intensifiers': [], 'negations': [],
+            },
+            'aspects': {},
+        })
+
+
+class AnalysisStreamTests(SimpleTestCase):
+    def setUp(self):
+        self.analyzer = SentimentAnalyzer()
+        self.text = ' '.join(
+            f'The {item} is {word} for everyday use.'
+            for item in ('kettle', 'lid', 'handle', 'cord', 'base', 'spout')
+            for word in ('excellent', 'terrible', 'fine')
+        )
+
+    def test_word_analysis_is_sent_before_sentences_are_scored(self):
+        with mock.patch.object(self.analyzer, 'analyze_sentiment', wraps=self.analyzer.analyze_sentiment) as analyze:
+            sections = self.analyzer.iter_analysis(self.text)
+            for section, data in sections:
+                if section == 'word_analysis':
+                    break
+            self.assertEqual(analyze.call_count, 1)
+
+            self.assertEqual(next(sections)[0], 'summary_positive')
+            self.assertGreater(analyze.call_count, 1)
+
+    def test_sections_match_the_full_summary(self):
+        sections = dict(self.analyzer.iter_analysis(self.text))
+        summary = self.analyzer.summarizer(self.text, sentences_per_section=3)
+        for section in ('positive', 'negative', 'neutral'):
+            self.assertEqual(sections[f'summary_{section}'], summary[section])
+            self.assertEqual(sections['distribution'][section], len(summary[section]))
+        self.assertEqual(sections['distribution']['total'], 9)
+
+
+class LemmatizerTests(SimpleTestCase):
+    def setUp(self):
+        self.analyzer = SentimentAnalyzer()
+        self.exact = SentimentAnalyzer(normalize=False)
+        self.lemma = self.analyzer.lemmatizer.lemma
+
+    def test_inflected_lexicon_words_match(self):
+        self.assertEqual(self.lemma('loving'), 'love')
+        self.assertEqual(self.lemma('batteries'), 'battery')
+        self.assertEqual(self.lemma('disappointments'), 'disappointed')
+
+    def test_words_are_never_normalized_into_negations_or_intensifiers(self):
+        self.assertIsNone(self.lemma('notes'))
+        self.assertEqual(self.lemma('not'), 'not')
+        modifiers = self.analyzer.negations | self.analyzer.intensifiers
+        for word in modifiers:
+            for suffix in ('s', 'es', 'ed', 'ing', 'ly', 'ness'):
+                token = word + suffix
+                if token not in self.analyzer.vocabulary:
+                    self.assertNotIn(self.lemma(token), modifiers, token)
+
+    def test_short_words_only_match_exactly(self):
+        self.assertEqual(self.lemma('fit'), 'fit')
+        self.assertIsNone(self.lemma('fits'))
+        self.assertIsNone(self.lemma('props'))
+
+    def test_unrelated_words_sharing_a_stem_stay_unknown(self):
+        self.assertIsNone(self.lemma('hardness'))
+        self.assertIsNone(self.lemma('killing'))
+
+    def test_normalization_keeps_the_exact_sentiment(self):
+        for text in ('Nice notes, excellent pen.', 'The hardness of the case is fine.'):
+            self.assertEqual(self.analyzer.analyze_sentiment(text)[:2], self.exact.analyze_sentiment(text)[:2], text)
+
+    def test_hits_show_the_original_token(self):
+        details = self.analyzer.analyze_sentiment('Loving it, despite the disappointments.')[2].hits.to_dict()
+        self.assertEqual([hit['word'] for hit in details['positive_words']], ['loving'])
+        self.assertEqual([hit['word'] for hit in details['negative_words']], ['disappointments'])
+
+    # On a private copy of the lexicon, so no other test's analyzers share these lemmatizers
+    def test_evicted_languages_free_their_lemmatizer(self):
+        data_dir = os.path.join(tempfile.mkdtemp(), 'sentiment_data')
+        self.addCleanup(shutil.rmtree, os.path.dirname(data_dir))
+        shutil.copytree(SentimentAnalyzer().data_dir, data_dir)
+
+        analyzer = MultilingualAnalyzer(data_dir=data_dir, max_loaded=1)
+        lemmatizers = {}
+        for language in ('de', 'es', 'fr', 'en'):
+            lemmatizers[language] = weakref.ref(analyzer.shard(language).lemmatizer)
+        self.assertEqual(list(analyzer.shards.loaded), ['en'])
+        self.assertEqual([language for language, ref in lemmatizers.items() if ref() is not None], ['en'])
+
+
+class MultilingualTests(SimpleTestCase):
+    def setUp(self):
+        self.analyzer = MultilingualAnalyzer()
+
+    def test_languages_are_detected(self):
+        detect = self.analyzer.detect_language
+        self.assertEqual(detect('The kettle is excellent and the lid works perfectly.'), 'en')
+        self.assertEqual(detect('El producto llegó rápido y la calidad es muy buena.'), 'es')
+        self.assertEqual(detect('Das Produkt ist schnell angekommen und die Qualität ist sehr gut.'), 'de')
+        self.assertEqual(detect('Le produit est arrivé vite et la qualité est très bonne.'), 'fr')
+
+    def test_short_or_unknown_text_falls_back_to_english(self):
+        self.assertEqual(self.analyzer.detect_language('Great!', 'en'), 'en')
+        self.assertEqual(self.analyzer.detect_language('12345', 'en'), 'en')
+        self.assertEqual(self.analyzer.shard('pt'), self.analyzer.shard('en'))
+
+    def test_reviews_use_the_lexicon_of_their_language(self):
+        self.assertEqual(
+            self.analyzer.analyze_sentiment('El producto no es bueno y la calidad no es buena.')[:2], ('negative', -1.0)
+        )
+        self.assertEqual(
+            self.analyzer.analyze_sentiment('Das Produkt ist nicht gut, die Qualität ist schlecht.')[:2], ('negative', -1.0)
+        )
+
+    def test_sentences_are_routed_separately(self):
+        text = 'The kettle is excellent and the lid is sturdy. El producto no es bueno y la calidad es terrible.'
+        words = MultilingualAnalyzer(route='sentence').analyze_sentiment(text)[2].hits.to_dict()
+        self.assertEqual([hit['word'] for hit in words['positive_words']], ['excellent', 'sturdy'])
+        self.assertEqual([hit['word'] for hit in words['negative_words']], ['bueno', 'terrible'])
+
+    def test_inherits_the_default_lexicon(self):
+        self.assertIn('excellent', self.analyzer.positive_words)
+        self.assertIn('excellent', self.analyzer.vocabulary)
+        self.assertIsNotNone(self.analyzer.lemmatizer)
+
+    def test_least_recently_used_language_is_dropped(self):
+        shards = LexiconShards(max_loaded=2)
+        german = shards.get('de')
+        shards.get('es')
+        self.assertIs(shards.get('de'), german)
+        shards.get('fr')
+        self.assertEqual(list(shards.loaded), ['de', 'fr'])
+        shards.get('es')
+        self.assertEqual(list(shards.loaded), ['fr', 'es'])
+        self.assertIsNot(shards.get('de'), german)
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('uploader', password='pw')
+        self.analyzer = SentimentAnalyzer()
+
+    def upload(self, reviews, name='reviews.jsonl'):
+        data = ''.join(json.dumps({'review': review}) + '\n' for review in reviews)
+        return SimpleUploadedFile(name, data.encode())
+
+    def test_every_row_is_saved(self):
+        stats = ingest.ingest_upload(self.user, self.upload(['Great kettle.', '', 'Awful lid.']), self.analyzer, 'Kettle')
+        self.assertEqual((stats['total'], stats['skipped']), (2, 1))
+        self.assertEqual(AnalysisResult.objects.filter(user=self.user).count(), 2)
+
+    def test_failed_batch_is_not_saved_again(self):
+        reviews = ['Great kettle.'] * (ingest.BATCH_SIZE + 5)
+        with mock.patch.object(ingest, 'save_batch', side_effect=DatabaseError('disk full')) as save_batch:
+            with self.assertRaisesMessage(DatabaseError, 'disk full'):
+                ingest.ingest_upload(self.user, self.upload(reviews), self.analyzer, 'Kettle')
+        self.assertEqual(save_batch.call_count, 1)
+
+    def test_failed_corpus_batch_is_not_saved_again(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('Great kettle.\n' * (ingest.BATCH_SIZE + 5))
+        self.addCleanup(os.remove, f.name)
+        with mock.patch('main.management.commands.score_corpus.save_batch',
+                        side_effect=DatabaseError('disk full')) as save_batch:
+            with self.assertRaisesMessage(DatabaseError, 'disk full'):
+                call_command('score_corpus', f.name, workers=1, save=True, user='uploader', stderr=io.StringIO())
+        self.assertEqual(save_batch.call_count, 1)
+
+    def test_rows_before_a_bad_row_are_kept(self):
+        upload = SimpleUploadedFile('reviews.jsonl', b'{"review": "Great kettle."}\nnot json\n')
+        with self.assertRaisesMessage(ingest.IngestError, 'Invalid JSON on line 2'):
+            ingest.ingest_upload(self.user, upload, self.analyzer, 'Kettle')
+        self.assertEqual(AnalysisResult.objects.filter(user=self.user).count(), 1)
+
+    @override_settings(REVIEW_INGEST={'MAX_TEXT_BYTES': 100})
+    def test_review_text_is_capped(self):
+        with self.assertRaises(ingest.IngestError):
+            ingest.ingest_upload(self.user, self.upload(['Great kettle, really.'] * 10), self.analyzer, 'Kettle')
+        self.assertEqual(AnalysisResult.objects.filter(user=self.user).count(), 4)
+
+    # 200 KB of gzip that expands to 200 MB; every path must stop close to the limit
+    @override_settings(REVIEW_INGEST={'MAX_DECOMPRESSED_BYTES': 1024 * 1024, 'MAX_TEXT_BYTES': 4 * 1024 * 1024})
+    def test_decompression_is_capped(self):
+        bomb = gzip.compress(b'a' * (200 * 1024 * 1024))
+        with self.assertRaisesMessage(ingest.IngestError, 'more than 1 MB once decompressed'):
+            ingest.read_single_review(SimpleUploadedFile('review.txt.gz', bomb))
+        with self.assertRaisesMessage(ingest.IngestError, 'more than 1 MB once decompressed'):
+            ingest.ingest_upload(self.user, SimpleUploadedFile('reviews.jsonl.gz', bomb), self.analyzer, 'Kettle')
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as f:
+            f.writestr('a.jsonl', json.dumps({'review': 'Great kettle.'}) + '\n')
+            f.writestr('b.txt', 'a' * (2 * 1024 * 1024))
+        with self.assertRaisesMessage(ingest.IngestError, 'more than 1 MB once decompressed'):
+            ingest.ingest_upload(self.user, SimpleUploadedFile('reviews.zip', archive.getvalue()), self.analyzer, 'Kettle')
+        self.assertEqual(AnalysisResult.objects.filter(user=self.user).count(), 1)
+
+    @override_settings(REVIEW_INGEST={'MAX_TEXT_BYTES': 100})
+    def test_long_documents_and_lines_are_refused(self):
+        with self.assertRaisesMessage(ingest.IngestError, 'longer than'):
+            ingest.read_single_review(SimpleUploadedFile('review.txt', b'a' * 101))
+        self.assertEqual(ingest.read_single_review(SimpleUploadedFile('review.txt', b'a' * 100)), 'a' * 100)
+        upload = SimpleUploadedFile('reviews.jsonl', json.dumps({'review': 'a' * 200}).encode() + b'\n')
+        with self.assertRaisesMessage(ingest.IngestError, 'Line 1 is longer than'):
+            ingest.ingest_upload(self.user, upload, self.analyzer, 'Kettle')
+
+
+ADMISSION = {
+    'VIEWS': {'analyze': ['POST']},
+    'INGEST_VIEWS': [],
+    'PER_USER_SLOTS': 1,
+    'GLOBAL_SLOTS': 4,
+    'MAX_INPUT_BYTES': 1000,
+    'SLOT_TIMEOUT': 30,
+    'QUEUE_WAIT': 0,
+    'RETRY_AFTER': 1,
+}
+
+
+@override_settings(ANALYSIS_ADMISSION=ADMISSION)
+class AdmissionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('busy', password='pw')
+        self.client.force_login(self.user)
+
+    def analyze(self, client=None, size=10):
+        return (client or self.client).post('/analyze/', {'product_name': 'Kettle', 'review_text': 'x' * size})
+
+    # CsrfViewMiddleware would answer 403 if it had parsed the body first
+    def test_oversized_body_is_rejected_before_it_is_parsed(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        self.assertEqual(self.analyze(client, size=5000).status_code, 413)
+        self.assertEqual(self.analyze(client).status_code, 403)
+
+    @override_settings(ANALYSIS_ADMISSION={**ADMISSION, 'INGEST_VIEWS': ['analyze']})
+    def test_ingest_views_take_the_upload_limit(self):
+        self.assertEqual(self.analyze(size=5000).status_code, 302)
+
+    def test_busy_user_is_asked_to_retry(self):
+        admission = SlotPool().acquire(self.user.pk)
+        self.assertEqual(self.analyze().status_code, 429)
+        admission.release()
+        self.assertEqual(self.analyze().status_code, 302)
+
+    def test_renew_takes_back_an_expired_slot(self):
+        admission = SlotPool().acquire(self.user.pk)
+        for key in admission.keys:
+            cache.delete(key)
+        admission.renewed_at -= admission_settings()['SLOT_TIMEOUT']
+        admission.renew()
+        self.assertEqual([cache.get(key) for key in admission.keys], [admission.token] * 2)
+        self.assertIsNone(SlotPool().acquire(self.user.pk))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Partitioning is only supported on PostgreSQL')
+class PartitionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('archivist', password='pw')
+        now = timezone.now()
+        self.old = self.save_at(now - timedelta(days=3 * 365), 'Old kettle, excellent.')
+        self.current = self.save_at(now, 'Current kettle, excellent.')
+        # Beyond the partitions convert creates, so it lands in the default partition
+        self.future = self.save_at(now + timedelta(days=365), 'Future kettle, excellent.')
+        bump_data_version(self.user)
+
+    def save_at(self, created_at, text):
+        analysis = save_review(self.user, 'Kettle', text)
+        AnalysisResult.objects.filter(pk=analysis.pk).update(created_at=created_at)
+        analysis.refresh_from_db()
+        index_analysis(analysis)
+        return analysis
+
+    def rows_in(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT id FROM {table}")
+            return {row[0] for row in cursor.fetchall()}
+
+    def version(self):
+        return UserDataVersion.objects.get(user=self.user).version
+
+    def test_create_moves_rows_out_of_the_default_partition(self):
+        call_command('partition_analyses', 'convert', months_ahead=3, stdout=io.StringIO())
+        self.assertEqual(self.rows_in(DEFAULT_PARTITION), {self.future.id})
+
+        call_command('partition_analyses', 'create', months_ahead=13, stdout=io.StringIO())
+        future_partition = partition_name(month_start(self.future.created_at.date()))
+        self.assertEqual(self.rows_in(future_partition), {self.future.id})
+        self.assertEqual(self.rows_in(DEFAULT_PARTITION), set())
+        self.assertEqual(AnalysisResult.objects.count(), 3)
+
+    def test_archive_removes_old_rows_and_bumps_data_versions(self):
+        call_command('partition_analyses', 'convert', months_ahead=3, stdout=io.StringIO())
+        version = self.version()
+
+        call_command('partition_analyses', 'archive', retain_months=12, archive_table=True,
+                     stdout=io.StringIO())
+        self.assertEqual(
+            set(AnalysisResult.objects.values_list('id', flat=True)), {self.current.id, self.future.id}
+        )
+        self.assertIn(self.old.id, self.rows_in('analysis_results_archive'))
+        self.assertFalse(WordOccurrence.objects.filter(analysis_id=self.old.id).exists())
+        self.assertTrue(WordOccurrence.objects.filter(analysis_id=self.current.id).exists())
+        self.assertEqual(self.version(), version + 1)
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='pw')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        use_replica(False)
+
+    # The data version and the rows it versions must come from the same database
+    def test_a_request_reads_everything_from_one_replica(self):
+        router = ReplicaRouter()
+        with mock.patch('main.routers.replica_aliases', return_value=['replica1', 'replica2', 'replica3']):
+            for _ in range(20):
+                use_replica(True)
+                aliases = {router.db_for_read(model) for model in (AnalysisResult, UserDataVersion, WordOccurrence)}
+                self.assertEqual(len(aliases), 1)
+                self.assertNotEqual(aliases, {'default'})
+        use_replica(False)
+        self.assertEqual(router.db_for_read(UserDataVersion), 'default')
+
+    def test_session_is_pinned_only_after_a_write(self):
+        self.client.post('/analyze/', {'product_name': 'Kettle', 'review_text': 'Great kettle.'})
+        self.assertNotIn(PIN_SESSION_KEY, self.client.session)
+
+        analysis = save_review(self.user, 'Kettle', 'Great kettle.')
+        self.client.post(f'/delete-analysis/{analysis.id}/')
+        self.assertIn(PIN_SESSION_KEY, self.client.session)
+
+
+class DataVersionCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cached', password='pw')
+        self.client.force_login(self.user)
+
+    def etag(self, path='/dashboard/'):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_repeat_request_is_not_modified(self):
+        etag = self.etag()
+        self.assertEqual(self.client.get('/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_etag_changes_after_a_save(self):
+        etag = self.etag()
+        self.client.post('/save-analysis/', {'product_name': 'Kettle', 'review_text': 'Excellent.'})
+        response = self.client.get('/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_pending_messages_are_never_not_modified(self):
+        analysis = save_review(self.user, 'Kettle', 'Excellent kettle.')
+        etag = self.etag('/history/')
+        # Data version held still, so only the message the delete leaves can stop the 304
+        with mock.patch('main.views.bump_data_version'):
+            self.client.post(f'/delete-analysis/{analysis.id}/')
+        response = self.client.get('/history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Analysis deleted successfully!')
+
+    def test_a_new_build_invalidates_etags(self):
+        self.addCleanup(build_version.cache_clear)
+        with self.settings(BUILD_VERSION='release-1'):
+            build_version.cache_clear()
+            etag = self.etag()
+        with self.settings(BUILD_VERSION='release-2'):
+            build_version.cache_clear()
+            self.assertEqual(self.client.get('/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_history_counts_are_shared_by_all_pages(self):
+        with mock.patch('main.views.cached_for_user', wraps=cached_for_user) as cached:
+            self.client.get('/history/', {'sentiment': 'positive'})
+            self.client.get('/history/', {'sentiment': 'positive', 'page': 2})
+        names = {call.args[1] for call in cached.call_args_list}
+        self.assertEqual(names, {'history-counts:sentiment=positive'})
+
+    # Two first saves racing: the update finds no row, then the insert collides with the other one
+    def test_bump_recovers_from_a_concurrent_insert_inside_a_transaction(self):
+        bump_data_version(self.user)
+        update = QuerySet.update
+        calls = []
+
+        def first_update_misses(queryset, **kwargs):
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        with transaction.atomic():
+            with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=first_update_misses):
+                bump_data_version(self.user)
+            self.assertEqual(UserDataVersion.objects.get(user=self.user).version, 2)
+
+    def test_reindexing_invalidates_etags(self):
+        save_review(self.user, 'Kettle', 'Excellent kettle.')
+        etag = self.etag()
+        call_command('build_word_index', rescore_aspects=True, stdout=io.StringIO())
+        self.assertEqual(self.client.get('/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+class WordIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('indexer', password='pw')
+        self.client.force_login(self.user)
+        for product, text in (
+            ('Kettle', 'Excellent lid, excellent spout.'),
+            ('Kettle', 'Excellent handle.'),
+            ('Lamp', 'Reliable switch.'),
+        ):
+            index_analysis(save_review(self.user, product, text))
+
+    def test_top_words(self):
+        self.assertEqual(top_words(self.user, 'positive', limit=1), [{'word__text': 'excellent', 'total': 3, 'reviews': 2}])
+        self.assertEqual(
+            [row['word__text'] for row in top_words(self.user, 'positive', product_name='Lamp')], ['reliable']
+        )
+        self.assertEqual(
+            [(row['word__text'], row['total']) for row in top_words(self.user, 'positive', product_name='Kettle', last=1)],
+            [('excellent', 1)],
+        )
+
+    def test_failed_indexing_does_not_save_the_analysis(self):
+        # The view prints the traceback of a failed save
+        with mock.patch('main.views.index_analysis', side_effect=DatabaseError('index failed')), \
+                mock.patch('traceback.print_exc'), mock.patch('builtins.print'):
+            self.client.post('/save-analysis/', {'product_name': 'Kettle', 'review_text': 'Excellent.'})
+        self.assertEqual(AnalysisResult.objects.filter(user=self.user).count(), 3)
+
+
+class CorpusWorkerTests(SimpleTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(['The kettle is lovely and the lid fits.', 'It stopped working, so disappointing.'] * 20))
+        self.addCleanup(os.remove, self.path)
+
+    def scores(self, analyzer, workers):
+        return [(row['sentiment'], row['score'], row['positive'], row['negative'])
+                for row in analyzer.analyze_file(self.path, workers=workers, chunk_bytes=256)]
+
+    # "lovely" and "disappointing" only match the lexicon once normalized
+    def test_workers_build_the_given_analyzer(self):
+        for analyzer in (SentimentAnalyzer(normalize=False), SentimentAnalyzer(), MultilingualAnalyzer()):
+            self.assertEqual(self.scores(analyzer, 2), self.scores(analyzer, 1))
+        self.assertNotEqual(self.scores(SentimentAnalyzer(normalize=False), 2), self.scores(SentimentAnalyzer(), 2))
+
+    def test_collector_needs_a_single_worker(self):
+        analyzer = SentimentAnalyzer(collector=UnknownWordCollector())
+        with self.assertRaises(ValueError):
+            list(analyzer.analyze_file(self.path, workers=2))
+
+
+# start() is patched out, so documents stay queued until flush() runs in the test
+@mock.patch.object(UnknownWordCollector, 'start')
+class UnknownWordCollectorTests(SimpleTestCase):
+    def record(self, collector, text):
+        tokens = text.split()
+        collector.record(tokens, list(range(len(tokens))))
+
+    def test_every_occurrence_is_counted(self, start):
+        collector = UnknownWordCollector(top_k=10)
+        self.record(collector, 'zorbix zorbix the zorbix flemwise')
+        self.record(collector, 'zorbix flemwise')
+        candidates = collector.flush()
+        self.assertIn(('word', 'zorbix', 4), candidates)
+        self.assertIn(('word', 'flemwise', 2), candidates)
+        self.assertIn(('bigram', 'zorbix flemwise', 2), candidates)
+        self.assertNotIn('the', {term for _, term, _ in candidates})
+
+    def test_only_unknown_tokens_are_queued(self, start):
+        collector = UnknownWordCollector()
+        tokens = ['excellent', 'zorbix'] * 1000
+        collector.record(tokens, list(range(1, len(tokens), 2)))
+        self.assertEqual(collector.queued_tokens, 1000)
+        self.assertEqual(set(collector.queue[0][0]), {'zorbix'})
+
+    def test_queue_is_bounded_by_queued_tokens(self, start):
+        collector = UnknownWordCollector(max_queued_tokens=50, flush_every=10 ** 6)
+        for document in range(100):
+            self.record(collector, f'word{document}a word{document}b')
+        self.assertLessEqual(collector.queued_tokens, 50)
+        self.assertEqual(collector.queue[-1][0], ['word99a', 'word99b'])
+        collector.process_queue()
+        self.assertEqual(collector.pending, 100)
+
+
+class LoadTestTests(SimpleTestCase):
+    def test_users_back_off_after_connection_errors(self):
+        client = mock.Mock(base_url='http://127.0.0.1:1')
+        client.request = mock.AsyncMock(side_effect=ConnectionRefusedError)
+        client.close = mock.AsyncMock()
+        user = VirtualUser(client, Recorder(), {'user_prefix': 'loadtest-', 'seed': 1}, 0)
+
+        with mock.patch.object(VirtualUser, 'signup_and_login', mock.AsyncMock()):
+            asyncio.run(user.run(time.monotonic() + 1, None))
+        # 0.1s doubling, halved at most by jitter: a handful of attempts, not a busy loop
+        self.assertLess(client.request.await_count, 10)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reviewer', password='pw')
+        self.other = User.objects.create_user('other', password='pw')
+        _, key = ApiToken.create_token(self.user)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {key}'}
+
+    def test_token_authenticates_api_requests(self):
+        response = self.client.post(
+            '/api/analyses/', json.dumps({'product_name': 'Kettle', 'review_text': 'Excellent kettle.'}),
+            content_type='application/json', **self.auth
+        )
+        self.assertEqual(response.status_code, 201)
+        analysis = AnalysisResult.objects.get(pk=response.json()['id'])
+        self.assertEqual((analysis.user, analysis.overall_sentiment), (self.user, 'positive'))
+
+        response = self.client.get(f'/api/analyses/{analysis.id}/', **self.auth)
+        self.assertEqual(response.json()['product_name'], 'Kettle')
+
+    def test_api_requires_a_token(self):
+        response = self.client.get('/api/analyses/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        self.assertEqual(self.client.get('/api/analyses/', HTTP_AUTHORIZATION='Token wrong').status_code, 401)
+
+        # A browser session is not an API credential
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/analyses/').status_code, 401)
+
+    def test_token_is_ignored_outside_the_api(self):
+        analysis = save_review(self.user, 'Kettle', 'Excellent kettle.')
+        client = Client(enforce_csrf_checks=True)
+
+        response = client.post(f'/delete-analysis/{analysis.id}/', **self.auth)
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(AnalysisResult.objects.filter(pk=analysis.id).exists())
+
+        response = client.get('/history/', **self.auth)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response['Location'])
+
+    def test_cursor_pagination_returns_every_row_once(self):
+        save_review(self.other, 'Other', 'Excellent kettle.')
+        ids = [save_review(self.user, f'Kettle {n}', 'Excellent kettle.').id for n in range(5)]
+        # Two rows share a timestamp, the cursor breaks the tie on id
+        now = timezone.now()
+        for n, analysis_id in enumerate(ids):
+            AnalysisResult.objects.filter(pk=analysis_id).update(created_at=now - timedelta(minutes=min(n, 3)))
+
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            page = self.client.get('/api/analyses/', {'limit': 2, 'cursor': cursor}, **self.auth).json()
+            self.assertLessEqual(len(page['results']), 2)
+            seen += [row['id'] for row in page['results']]
+            cursor = page['next_cursor']
+        self.assertEqual(seen, [ids[0], ids[1], ids[2], ids[4], ids[3]])
+
+        self.assertEqual(self.client.get('/api/analyses/', {'cursor': 'x'}, **self.auth).status_code, 400)
+
+    def test_bulk_fetch_reports_missing_ids(self):
+        first = save_review(self.user, 'Kettle', 'Excellent kettle.')
+        second = save_review(self.user, 'Lamp', 'Terrible lamp.')
+        hidden = save_review(self.other, 'Other', 'Excellent kettle.')
+
+        ids = [second.id, 999999, first.id, hidden.id]
+        response = self.client.get('/api/analyses/bulk/', {'ids': ','.join(map(str, ids))}, **self.auth)
+        self.assertEqual([row['id'] for row in response.json()['results']], [second.id, first.id])
+        self.assertEqual(response.json()['missing'], [999999, hidden.id])
+
+        response = self.client.post(
+            '/api/analyses/bulk/', json.dumps({'ids': [first.id], 'fields': ['product_name']}),
+            content_type='application/json', **self.auth
+        )
+        self.assertEqual(response.json()['results'], [{'id': first.id, 'product_name': 'Kettle'}])
+
+    def test_fields_selection(self):
+        analysis = save_review(self.user, 'Kettle', 'Excellent kettle.')
+        response = self.client.get(
+            f'/api/analyses/{analysis.id}/', {'fields': 'overall_sentiment,aspects'}, **self.auth
+        )
+        self.assertEqual(set(response.json()), {'id', 'overall_sentiment', 'aspects'})
+
+        response = self.client.get(f'/api/analyses/{analysis.id}/', {'fields': 'password'}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.landing, name='landing'),
@@ -8,10 +8,16 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('analyze/', views.analyze, name='analyze'),
     path('history/', views.history, name='history'),
+    path('history/export/', views.export_history, name='export_history'),
     path('logout/', views.logout, name='logout'),
     path('result/', views.result, name='result'),
+    path('result/live/', views.result_live, name='result_live'),
+    path('result/stream/', views.result_stream, name='result_stream'),
     path('save-analysis/', views.save_analysis, name='save_analysis'),
     path('analysis/<int:analysis_id>/', views.analysis_detail, name='analysis_detail'),
     path('delete-analysis/<int:analysis_id>/', views.delete_analysis, name='delete_analysis'),
+    path('api/analyses/', api.analyses, name='api_analyses'),
+    path('api/analyses/bulk/', api.analyses_bulk, name='api_analyses_bulk'),
+    path('api/analyses/<int:analysis_id>/', api.analysis_detail, name='api_analysis_detail'),
     
 ]
@@ -5,10 +5,24 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.shortcuts import get_object_or_404
 import json
-from django.db.models import Avg
-from .models import AnalysisResult
+from django.core.paginator import Paginator
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+from .models import AnalysisResult, compact_aspects
+from .admission import renew_admission
+from .ingest import IngestError, ingest_upload, is_multi_record, read_single_review
+from .caching import (
+    FRAGMENT_CACHE_TIMEOUT, bump_data_version, cached_for_user, conditional_on_user_data, fragment_version,
+)
+from .lexicon import get_analyzer
+from .export import EXPORT_FORMATS, export_filename, export_stream, parse_columns
+from .search import filter_analyses, search_analyses
+from .word_index import analyses_with_word, aspect_summary, index_analysis, top_words
 
-from utilities.sentiment import SentimentAnalyzer
+
+HISTORY_PAGE_SIZE = 20
+LIVE_RESULT_MIN_CHARS = 20000
 
 #Views
 def landing(request):
@@ -69,10 +83,10 @@ def logout(request):
     return redirect('landing')
 
 
-@login_required
-def dashboard(request):
+# Dashboard statistics, cached per user data version
+def get_dashboard_stats(user):
     # Get user's analyses
-    analyses = AnalysisResult.objects.filter(user=request.user)
+    analyses = AnalysisResult.objects.filter(user=user)
     
     # Basic counts
     total_analyses = analyses.count()
@@ -85,9 +99,6 @@ def dashboard(request):
     negative_percentage = round((negative_count / total_analyses * 100) if total_analyses > 0 else 0, 1)
     neutral_percentage = round((neutral_count / total_analyses * 100) if total_analyses > 0 else 0, 1)
     
-    # Get recent analyses (last 5)
-    recent_analyses = analyses.order_by('-created_at')[:5]
-    
     # Calculate average word statistics
     if total_analyses > 0:
         avg_positive_words = analyses.aggregate(avg=Avg('positive_words'))['avg'] or 0
@@ -102,8 +113,13 @@ def dashboard(request):
     else:
         avg_positive_words = avg_negative_words = avg_neutral_words = 0
         avg_positive_percentage = avg_negative_percentage = avg_neutral_percentage = 0
+
+    # Most frequent praise and complaint words from the word index
+    top_praise_words = top_words(user, 'positive', limit=5) if total_analyses > 0 else []
+    top_complaint_words = top_words(user, 'negative', limit=5) if total_analyses > 0 else []
+    top_aspects = aspect_summary(user, limit=8) if total_analyses > 0 else []
     
-    context = {
+    return {
         'total_analyses': total_analyses,
         'positive_count': positive_count,
         'negative_count': negative_count,
@@ -111,13 +127,31 @@ def dashboard(request):
         'positive_percentage': positive_percentage,
         'negative_percentage': negative_percentage,
         'neutral_percentage': neutral_percentage,
-        'recent_analyses': recent_analyses,
         'avg_positive_words': avg_positive_words,
         'avg_negative_words': avg_negative_words,
         'avg_neutral_words': avg_neutral_words,
         'avg_positive_percentage': avg_positive_percentage,
         'avg_negative_percentage': avg_negative_percentage,
         'avg_neutral_percentage': avg_neutral_percentage,
+        'top_praise_words': top_praise_words,
+        'top_complaint_words': top_complaint_words,
+        'top_aspects': top_aspects,
+    }
+
+
+@login_required
+@conditional_on_user_data
+def dashboard(request):
+    stats = cached_for_user(request, 'dashboard', lambda: get_dashboard_stats(request.user))
+    
+    # Get recent analyses (last 5), only queried when the fragment is not cached
+    recent_analyses = AnalysisResult.objects.filter(user=request.user).order_by('-created_at')[:5]
+    
+    context = {
+        **stats,
+        'recent_analyses': recent_analyses,
+        'fragment_version': fragment_version(request),
+        'fragment_timeout': FRAGMENT_CACHE_TIMEOUT,
     }
     
     return render(request, 'dashboard.html', context)
@@ -139,9 +173,32 @@ def analyze(request):
             messages.info(request, 'Please provide reviews as text or upload a file.')
             return render(request, 'analyze.html')
         
+        if review_file and is_multi_record(review_file):
+            # CSV/JSONL (optionally gzip or zip): every row is saved as its own analysis
+            try:
+                stats = ingest_upload(
+                    request.user, review_file, get_analyzer(), product_name,
+                    text_column=request.POST.get('text_column', '').strip() or None,
+                    product_column=request.POST.get('product_column', '').strip() or None,
+                    on_batch=lambda: renew_admission(request),
+                )
+            except IngestError as e:
+                messages.error(request, str(e))
+                return render(request, 'analyze.html')
+            finally:
+                # Rows saved before an error still count as a change
+                bump_data_version(request.user)
+
+            messages.success(
+                request,
+                f"Analyzed {stats['total']} reviews across {len(stats['by_product'])} products"
+                + (f" ({stats['skipped']} empty rows skipped)" if stats['skipped'] else '')
+            )
+            return redirect('history')
+
         if review_file:
             try:
-                text = review_file.read().decode('utf-8')
+                text = read_single_review(review_file)
             except Exception as e:
                 messages.error(request, f"Error reading file: {e}")
                 return render(request, 'analyze.html')
@@ -150,11 +207,26 @@ def analyze(request):
             
         request.session['product_name'] = product_name
         request.session['review_text'] = text
+
+        # Long reviews get the progressive page so the overview shows up early
+        if len(text) >= LIVE_RESULT_MIN_CHARS:
+            return redirect('result_live')
         return redirect('result')
 
     return render(request, 'analyze.html')
 
 
+# Aspects for display, most mentioned first, plus the compact form for the save form
+def aspect_context(aspects):
+    return {
+        'aspects': sorted(
+            ({'aspect': aspect, 'score': score, 'mentions': mentions} for aspect, (score, mentions) in aspects.items()),
+            key=lambda item: (-item['mentions'], item['aspect'])
+        ),
+        'aspects_json': json.dumps(aspects),
+    }
+
+
 @login_required(login_url='login')
 def result(request):
     text = request.session.get('review_text')
@@ -163,7 +235,7 @@ def result(request):
     if not text or not product_name:
         return redirect('analyze')
     
-    analyzer = SentimentAnalyzer()
+    analyzer = get_analyzer()
     analysis = analyzer.comprehensive_analysis(text)
     
     context = {
@@ -173,12 +245,50 @@ def result(request):
         'overview': analysis['overview'],
         'summary': analysis['summary_by_sentiment'],
         'metrics': analysis['detailed_metrics'],
-        'word_analysis': analysis['word_analysis']
+        'word_analysis': analysis['word_analysis'],
+        **aspect_context(compact_aspects(analysis['aspect_analysis'])),
     }
     
     return render(request, 'result.html', context)
 
 
+@login_required(login_url='login')
+def result_live(request):
+    text = request.session.get('review_text')
+    product_name = request.session.get('product_name')
+    
+    if not text or not product_name:
+        return redirect('analyze')
+    
+    context = {
+        'product_name': product_name,
+        'review_text': text,
+    }
+    
+    return render(request, 'result_live.html', context)
+
+
+@login_required(login_url='login')
+def result_stream(request):
+    text = request.session.get('review_text')
+    
+    if not text:
+        return HttpResponseBadRequest('No review to analyze')
+    
+    analyzer = get_analyzer()
+
+    # Server-sent events, one per analysis section
+    def events():
+        for section, data in analyzer.iter_analysis(text):
+            yield f"event: {section}\ndata: {json.dumps(data)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def save_analysis(request):
     if request.method == 'POST':
@@ -191,6 +301,16 @@ def save_analysis(request):
                 except json.JSONDecodeError:
                     return default
 
+            # Compact aspect scores: {aspect: [score, mentions]}
+            aspects = safe_json_parse(request.POST.get('aspects'), {})
+            if not isinstance(aspects, dict):
+                aspects = {}
+            aspects = {
+                str(aspect).lower()[:100]: [float(values[0]), int(values[1])]
+                for aspect, values in aspects.items()
+                if isinstance(values, list) and len(values) == 2
+            }
+
             analysis = AnalysisResult(
                 user=request.user,
                 product_name=request.POST.get('product_name', ''),
@@ -222,9 +342,14 @@ def save_analysis(request):
                 neutral_words_list=safe_json_parse(request.POST.get('neutral_words_list')),
                 intensifiers_list=safe_json_parse(request.POST.get('intensifiers_list')),
                 negations_list=safe_json_parse(request.POST.get('negations_list')),
+                aspects=aspects,
             )
             
-            analysis.save()
+            # One transaction, so an analysis is never saved without its word index
+            with transaction.atomic():
+                analysis.save()
+                index_analysis(analysis)
+                bump_data_version(request.user)
             
         except Exception as e:
             print("ERROR saving analysis:", str(e))
@@ -237,35 +362,101 @@ def save_analysis(request):
     return redirect('analyze')
 
 
+# Search and filters from the query string, shared by history and export
+def get_filtered_analyses(request):
+    filters = {
+        'query': request.GET.get('q', '').strip(),
+        'sentiment': request.GET.get('sentiment', ''),
+        'date_from': request.GET.get('date_from', ''),
+        'date_to': request.GET.get('date_to', ''),
+        'word': request.GET.get('word', '').strip(),
+        'polarity': request.GET.get('polarity', ''),
+    }
+
+    analyses = AnalysisResult.objects.filter(user=request.user).order_by('-created_at')
+    analyses = filter_analyses(
+        analyses, sentiment=filters['sentiment'], date_from=filters['date_from'], date_to=filters['date_to']
+    )
+    if filters['word']:
+        analyses = analyses_with_word(analyses, request.user, filters['word'], filters['polarity'])
+    if filters['query']:
+        analyses = search_analyses(analyses, filters['query'])
+
+    return analyses, filters
+
+
 @login_required
+@conditional_on_user_data
 def history(request):
-    analyses = AnalysisResult.objects.filter(user=request.user).order_by('-created_at')
+    analyses, filters = get_filtered_analyses(request)
     
-    # Calculate summary statistics
-    positive_count = analyses.filter(overall_sentiment='positive').count()
-    negative_count = analyses.filter(overall_sentiment='negative').count()
-    neutral_count = analyses.filter(overall_sentiment='neutral').count()
+    # Current filters without the page number, for pagination links and the counts, which are the same on every page
+    filter_params = request.GET.copy()
+    filter_params.pop('page', None)
+
+    # Calculate summary statistics in a single query
+    counts = cached_for_user(request, f"history-counts:{filter_params.urlencode()}", lambda: analyses.order_by().aggregate(
+        positive_count=Count('id', filter=Q(overall_sentiment='positive')),
+        negative_count=Count('id', filter=Q(overall_sentiment='negative')),
+        neutral_count=Count('id', filter=Q(overall_sentiment='neutral')),
+    ))
+    total_count = counts['positive_count'] + counts['negative_count'] + counts['neutral_count']
+
+    paginator = Paginator(analyses, HISTORY_PAGE_SIZE)
+    # Reuse the cached total instead of a second COUNT query
+    paginator.count = total_count
+    page_obj = paginator.get_page(request.GET.get('page'))
     
     context = {
-        'analyses': analyses,
-        'positive_count': positive_count,
-        'negative_count': negative_count,
-        'neutral_count': neutral_count,
+        'analyses': page_obj.object_list,
+        'page_obj': page_obj,
+        'total_count': total_count,
+        'positive_count': counts['positive_count'],
+        'negative_count': counts['negative_count'],
+        'neutral_count': counts['neutral_count'],
+        **filters,
+        'is_filtered': any(filters.values()),
+        'filter_querystring': filter_params.urlencode(),
+        'fragment_version': fragment_version(request),
+        'fragment_timeout': FRAGMENT_CACHE_TIMEOUT,
     }
     
     return render(request, 'history.html', context)
 
+@login_required
+def export_history(request):
+    fmt = request.GET.get('format', 'csv')
+    compress = request.GET.get('gzip') in ('1', 'true', 'on')
+
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"Unsupported export format: {fmt}")
+    try:
+        columns = parse_columns(request.GET.get('columns'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    analyses, _ = get_filtered_analyses(request)
+
+    response = StreamingHttpResponse(
+        export_stream(analyses, columns, fmt=fmt, compress=compress),
+        content_type='application/gzip' if compress else EXPORT_FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(fmt, compress)}"'
+    return response
+
 @login_required
 def delete_analysis(request, analysis_id):
     analysis = get_object_or_404(AnalysisResult, id=analysis_id, user=request.user)
     
     if request.method == 'POST':
         analysis.delete()
+        bump_data_version(request.user)
         messages.success(request, 'Analysis deleted successfully!')
     
     return redirect('history')
 
 @login_required
+@conditional_on_user_data
 def analysis_detail(request, analysis_id):
     # Get the analysis or return 404
     analysis = get_object_or_404(AnalysisResult, id=analysis_id, user=request.user)
@@ -314,6 +505,9 @@ def analysis_detail(request, analysis_id):
             'negations': analysis.negations_list,
         },
         
+        # Aspect analysis
+        **aspect_context(analysis.aspects),
+        
         # Flag
         'is_saved_analysis': True
     }
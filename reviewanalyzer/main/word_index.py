@@ -0,0 +1,144 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Avg, Count, Sum
+
+from .models import AnalysisResult, AspectScore, SentimentWord, WordOccurrence
+
+POLARITY_FIELDS = {
+    'positive': 'positive_words_list',
+    'negative': 'negative_words_list',
+}
+
+
+#Word hits are stored as dicts from analyze_sentiment, older rows may hold plain strings
+def count_words(word_list):
+    counts = Counter()
+    for item in word_list or []:
+        word = item.get('word') if isinstance(item, dict) else item
+        if isinstance(word, str) and word:
+            counts[word.lower()[:100]] += 1
+    return counts
+
+
+def get_word_ids(words):
+    words = set(words)
+    if not words:
+        return {}
+
+    word_ids = dict(SentimentWord.objects.filter(text__in=words).values_list('text', 'id'))
+    missing = words - word_ids.keys()
+    if missing:
+        SentimentWord.objects.bulk_create(
+            [SentimentWord(text=word) for word in missing], ignore_conflicts=True
+        )
+        word_ids.update(SentimentWord.objects.filter(text__in=missing).values_list('text', 'id'))
+
+    return word_ids
+
+
+#Rebuild the occurrence rows of the given analyses
+def index_analyses(analyses):
+    analyses = list(analyses)
+    if not analyses:
+        return 0
+
+    counts = []
+    for analysis in analyses:
+        for polarity, field in POLARITY_FIELDS.items():
+            for word, count in count_words(getattr(analysis, field)).items():
+                counts.append((analysis, polarity, word, count))
+
+    aspects = [
+        (analysis, aspect, values)
+        for analysis in analyses
+        for aspect, values in (analysis.aspects or {}).items()
+    ]
+
+    word_ids = get_word_ids([word for _, _, word, _ in counts] + [aspect for _, aspect, _ in aspects])
+    occurrences = [
+        WordOccurrence(
+            word_id=word_ids[word],
+            analysis_id=analysis.id,
+            user_id=analysis.user_id,
+            polarity=polarity,
+            count=count,
+        )
+        for analysis, polarity, word, count in counts
+    ]
+    aspect_scores = [
+        AspectScore(
+            aspect_id=word_ids[aspect],
+            analysis_id=analysis.id,
+            user_id=analysis.user_id,
+            score=score,
+            mentions=mentions,
+        )
+        for analysis, aspect, (score, mentions) in aspects
+    ]
+
+    with transaction.atomic():
+        analysis_ids = [a.id for a in analyses]
+        WordOccurrence.objects.filter(analysis__in=analysis_ids).delete()
+        AspectScore.objects.filter(analysis__in=analysis_ids).delete()
+        WordOccurrence.objects.bulk_create(occurrences, batch_size=1000)
+        AspectScore.objects.bulk_create(aspect_scores, batch_size=1000)
+
+    return len(occurrences)
+
+
+def index_analysis(analysis):
+    return index_analyses([analysis])
+
+
+#Top-N words for a user, e.g. the most frequent complaints
+def top_words(user, polarity, product_name=None, last=None, limit=10):
+    occurrences = WordOccurrence.objects.filter(user=user, polarity=polarity)
+
+    analyses = AnalysisResult.objects.filter(user=user)
+    if product_name:
+        analyses = analyses.filter(product_name=product_name)
+    if last:
+        # The ids are fetched first: MySQL rejects a LIMIT inside an IN subquery, PostgreSQL plans it poorly
+        occurrences = occurrences.filter(
+            analysis_id__in=list(analyses.order_by('-created_at').values_list('id', flat=True)[:last])
+        )
+    elif product_name:
+        occurrences = occurrences.filter(analysis__in=analyses.values('id'))
+
+    # Grouped by word id without joining sentiment_words; one occurrence row per analysis and word,
+    # so counting rows counts reviews. Only the texts of the top words are looked up.
+    rows = list(
+        occurrences.values('word')
+        .annotate(total=Sum('count'), reviews=Count('id'))
+        .order_by('-total', 'word')[:limit]
+    )
+    texts = dict(SentimentWord.objects.filter(id__in=[row['word'] for row in rows]).values_list('id', 'text'))
+    return [{'word__text': texts[row['word']], 'total': row['total'], 'reviews': row['reviews']} for row in rows]
+
+
+#Drill down from a word to the analyses that contain it
+def analyses_with_word(queryset, user, word, polarity=None):
+    if polarity == 'aspect':
+        scores = AspectScore.objects.filter(user=user, aspect__text=word.lower())
+        return queryset.filter(id__in=scores.values('analysis_id'))
+
+    occurrences = WordOccurrence.objects.filter(user=user, word__text=word.lower())
+    if polarity in POLARITY_FIELDS:
+        occurrences = occurrences.filter(polarity=polarity)
+    return queryset.filter(id__in=occurrences.values('analysis_id'))
+
+
+#Per-aspect sentiment across a user's reviews, e.g. battery sentiment over all products
+def aspect_summary(user, aspect=None, product_name=None, limit=10):
+    scores = AspectScore.objects.filter(user=user)
+    if aspect:
+        scores = scores.filter(aspect__text=aspect.lower())
+    if product_name:
+        scores = scores.filter(analysis__in=AnalysisResult.objects.filter(user=user, product_name=product_name).values('id'))
+
+    return list(
+        scores.values('aspect__text')
+        .annotate(average=Avg('score'), total=Sum('score'), mentions=Sum('mentions'), reviews=Count('analysis'))
+        .order_by('-reviews', 'aspect__text')[:limit]
+    )
@@ -33,8 +33,11 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'main.middleware.AdmissionControlMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.middleware.ApiTokenMiddleware',
+    'main.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,6 +76,100 @@ DATABASES = {
     }
 }
 
+# Read replicas: comma-separated host[:port][/name] entries, each one becomes an alias replica1, replica2, ...
+# with the other settings of 'default'. Replicas that differ further (ENGINE, USER, ...) are added to
+# DATABASES by hand and listed in DATABASE_REPLICAS, see the README.
+DATABASE_REPLICAS = []
+for index, entry in enumerate(filter(None, map(str.strip, os.environ.get('REVAN_DB_REPLICA_HOSTS', '').split(','))), start=1):
+    alias = f'replica{index}'
+    address, _, name = entry.partition('/')
+    host, _, port = address.partition(':')
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default'].get('PORT', ''),
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+
+# Read-only analytics views (URL names) that may read from a replica
+REPLICA_READ_VIEWS = ['dashboard', 'history', 'analysis_detail', 'export_history']
+
+# After a write, the session reads from the primary for this many seconds
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# Admission slots and cached page fragments must be shared by all workers in production
+
+# Part of every ETag and cached fragment key (main.caching.build_version). Set it per release, e.g. to the
+# commit hash, so all servers agree; when empty it is derived from the template and app file mtimes.
+BUILD_VERSION = os.environ.get('REVAN_BUILD_VERSION', '')
+
+if os.environ.get('REVAN_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REVAN_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Admission control for CPU-heavy analysis requests (main.middleware.AdmissionControlMiddleware)
+ANALYSIS_ADMISSION = {
+    'VIEWS': {
+        'analyze': ['POST'],
+        'result': ['GET'],
+        'result_stream': ['GET'],
+        'api_analyses': ['POST'],
+    },
+    # The analyze form also takes multi-record uploads; its body may be as large as REVIEW_INGEST['MAX_UPLOAD_BYTES']
+    # instead of MAX_INPUT_BYTES. Ingests renew their slots after every batch, streams after every event.
+    'INGEST_VIEWS': ['analyze'],
+    'PER_USER_SLOTS': 2,
+    'GLOBAL_SLOTS': 16,
+    'MAX_INPUT_BYTES': 50 * 1024 * 1024,
+    'SLOT_TIMEOUT': 300,
+    'QUEUE_WAIT': 2.0,
+    'RETRY_AFTER': 5,
+}
+
+# Multi-record uploads (main.ingest) are analyzed and saved inside the request worker, at roughly
+# 0.15-0.5 MB of review text per second. The limits keep one upload within a 120 s request timeout;
+# larger corpora go through 'manage.py score_corpus --save' on the server instead.
+REVIEW_INGEST = {
+    'MAX_UPLOAD_BYTES': 32 * 1024 * 1024,   # the file as sent, compressed or not
+    'MAX_TEXT_BYTES': 16 * 1024 * 1024,     # review text after decompression, and the longest single record
+    'MAX_DECOMPRESSED_BYTES': 32 * 1024 * 1024,  # .gz/.zip contents, so a small archive cannot expand unbounded
+}
+
+# Count words missing from the sentiment lexicon (main.lexicon), report with 'manage.py lexicon_candidates'
+LEXICON_COLLECTOR = {
+    'ENABLED': os.environ.get('REVAN_COLLECT_UNKNOWN_WORDS') == '1',
+    'WIDTH': 2 ** 14,
+    'DEPTH': 4,
+    'TOP_K': 500,
+    'FLUSH_EVERY': 1000,
+    'FLUSH_SECONDS': 300,
+}
+
+# Route each review (or sentence, 'ROUTE': 'sentence') to the lexicon of its language (utilities.languages).
+# Other languages live in subdirectories of utilities/sentiment_data; at most MAX_LOADED stay in memory.
+SENTIMENT_LANGUAGES = {
+    'ENABLED': os.environ.get('REVAN_MULTILINGUAL') == '1',
+    'ROUTE': 'review',
+    'DEFAULT_LANGUAGE': 'en',
+    'MAX_LOADED': 3,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,210 @@
+import json
+import mmap
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+RECORD_FORMATS = ('lines', 'jsonl', 'sentences')
+CHUNK_BYTES = 16 * 1024 * 1024
+SENTENCE_END = re.compile(rb'[.!?]')
+MIN_SENTENCE_CHARS = 11
+
+_worker_analyzer = None
+
+
+#Mapped read-only, pages are loaded by the OS as records are touched
+def open_mapped(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+#First record boundary at or after position: after a newline, or after a sentence terminator
+def next_boundary(mm, position, record_format):
+    if record_format == 'sentences':
+        match = SENTENCE_END.search(mm, position)
+        return match.end() if match else len(mm)
+    newline = mm.find(b'\n', position)
+    return newline + 1 if newline != -1 else len(mm)
+
+
+#Byte ranges of about chunk_bytes that never split a record; \n and .!? are never inside a UTF-8 character
+def chunk_ranges(mm, record_format, chunk_bytes=CHUNK_BYTES):
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = min(start + chunk_bytes, size)
+        if end < size:
+            end = next_boundary(mm, end, record_format)
+        yield start, end
+        start = end
+
+
+#(start, stop) offsets of the records in a byte range, found directly on the mapped bytes
+def record_spans(mm, start, end, record_format):
+    if record_format == 'sentences':
+        position = start
+        for match in SENTENCE_END.finditer(mm, start, end):
+            yield position, match.end()
+            position = match.end()
+        if position < end:
+            yield position, end
+        return
+
+    position = start
+    while position < end:
+        newline = mm.find(b'\n', position, end)
+        stop = newline if newline != -1 else end
+        yield position, stop
+        position = stop + 1
+
+
+#Decode one record only when it is scored, returns (product, text) or None to skip it
+def decode_record(raw, record_format, text_fields, product_field):
+    text = raw.decode('utf-8', errors='replace')
+
+    if record_format == 'sentences':
+        text = re.sub(r'^[,\-\s]+', '', ' '.join(text.split()))
+        return (None, text) if len(text) >= MIN_SENTENCE_CHARS else None
+
+    if record_format == 'lines':
+        text = text.strip()
+        return (None, text) if text else None
+
+    try:
+        row = json.loads(text) if text.strip() else None
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(row, dict):
+        return None
+    for field in text_fields:
+        if isinstance(row.get(field), str) and row[field].strip():
+            product = row.get(product_field) if product_field else None
+            return (str(product) if product is not None else None), row[field]
+    return None
+
+
+def compact_result(offset, product, sentiment, score, word_counts, aspects):
+    return {
+        'offset': offset,
+        'product': product,
+        'sentiment': sentiment,
+        'score': score,
+        'total_words': word_counts['total'],
+        'positive': word_counts['positive'],
+        'negative': word_counts['negative'],
+        'aspects': {aspect: values['score'] for aspect, values in aspects.items()},
+    }
+
+
+#Class and constructor options of the default analyzer; languages: MultilingualAnalyzer options, or None
+#for the single-lexicon analyzer
+def analyzer_spec(data_dir, aspect_window, languages=None):
+    if languages is not None:
+        from .languages import MultilingualAnalyzer
+        return MultilingualAnalyzer, dict(data_dir=data_dir, aspect_window=aspect_window, **languages)
+    from .sentiment import SentimentAnalyzer
+    return SentimentAnalyzer, dict(data_dir=data_dir, aspect_window=aspect_window)
+
+
+#Class and constructor options that rebuild a given analyzer in a worker process. Its collector
+#lives in this process and would never see what the workers score, so it is refused.
+def worker_spec(analyzer):
+    if analyzer.collector is not None:
+        raise ValueError('An analyzer with an unknown-word collector can only score with workers=1')
+    return type(analyzer), analyzer.worker_options
+
+
+def make_analyzer(data_dir, aspect_window, languages=None):
+    analyzer_class, options = analyzer_spec(data_dir, aspect_window, languages)
+    return analyzer_class(**options)
+
+
+def init_worker(analyzer_class, options):
+    global _worker_analyzer
+    _worker_analyzer = analyzer_class(**options)
+
+
+#Score every record in [start, end) of the file, returns (results, skipped).
+#With detail=True each result also carries the text and the comprehensive analysis.
+def score_range(path, start, end, record_format, text_fields=('text',), product_field=None,
+                detail=False, analyzer=None):
+    analyzer = analyzer or _worker_analyzer
+    results = []
+    skipped = 0
+
+    mm = open_mapped(path)
+    try:
+        for record_start, record_stop in record_spans(mm, start, end, record_format):
+            record = decode_record(mm[record_start:record_stop], record_format, text_fields, product_field)
+            if record is None:
+                # Blank lines and short sentence fragments are not counted as skipped
+                if record_format != 'sentences' and mm[record_start:record_stop].strip():
+                    skipped += 1
+                continue
+            product, text = record
+
+            if detail:
+                analysis = analyzer.comprehensive_analysis(text)
+                metrics = analysis['detailed_metrics']
+                result = compact_result(
+                    record_start, product, analysis['overview']['sentiment'], analysis['overview']['score'],
+                    {**metrics['word_counts'], 'total': metrics['total_words']}, analysis['aspect_analysis'],
+                )
+                result['text'] = text
+                result['analysis'] = analysis
+            else:
+                sentiment, score, scored = analyzer.analyze_sentiment(text)
+                result = compact_result(
+                    record_start, product, sentiment, score, scored.word_counts, scored.aspects
+                )
+            results.append(result)
+    finally:
+        mm.close()
+
+    return results, skipped
+
+
+#Yield (results, skipped) per chunk, in file order, scoring up to `workers` chunks at once.
+#Only a few chunks of results are held at a time, however large the file is.
+#With analyzer, workers build the same analyzer from its worker_options and data_dir, aspect_window
+#and languages are not used.
+def score_file_chunks(path, record_format='lines', workers=None, chunk_bytes=CHUNK_BYTES,
+                      text_fields=('text',), product_field=None, detail=False,
+                      analyzer=None, data_dir='utilities/sentiment_data', aspect_window=3, languages=None):
+    if record_format not in RECORD_FORMATS:
+        raise ValueError(f"Unsupported record format: {record_format}")
+
+    mm = open_mapped(path)
+    if mm is None:
+        return
+    options = dict(text_fields=tuple(text_fields), product_field=product_field, detail=detail)
+
+    try:
+        ranges = chunk_ranges(mm, record_format, chunk_bytes)
+        workers = workers or os.cpu_count() or 1
+
+        if workers == 1:
+            if analyzer is None:
+                analyzer = make_analyzer(data_dir, aspect_window, languages)
+            for start, end in ranges:
+                yield score_range(path, start, end, record_format, analyzer=analyzer, **options)
+            return
+
+        if analyzer is None:
+            spec = analyzer_spec(data_dir, aspect_window, languages)
+        else:
+            spec = worker_spec(analyzer)
+
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=spec) as pool:
+            pending = deque()
+            for start, end in ranges:
+                pending.append(pool.submit(score_range, path, start, end, record_format, **options))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    finally:
+        mm.close()
@@ -0,0 +1,244 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from .results import NEGATIVE, POSITIVE, SentimentResult, WordHits
+from .sentiment import SentimentAnalyzer
+
+DEFAULT_LANGUAGE = 'en'
+PROFILE_FILE = 'profile.txt'
+ROUTES = ('review', 'sentence')
+WORD = re.compile(r'[^\W\d_]+')
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+
+_shared_shards = {}
+_shared_lock = threading.Lock()
+
+
+#Languages under data_dir: the default language's lexicon is data_dir itself, others are subdirectories
+def language_dirs(data_dir, default_language=DEFAULT_LANGUAGE):
+    dirs = {default_language: data_dir}
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        if os.path.isfile(os.path.join(path, PROFILE_FILE)):
+            dirs[name] = path
+    return dirs
+
+
+def read_profile(path):
+    with open(os.path.join(path, PROFILE_FILE), 'r', encoding='utf-8') as f:
+        return [line.strip().lower() for line in f if line.strip()]
+
+
+#Character trigram language identification. Each profile is a list of the language's common words;
+#a text is scored by the log-probability of its trigrams under each profile, on at most max_chars characters.
+class LanguageDetector:
+    def __init__(self, profiles, n=3, max_chars=120, min_grams=12, min_margin=0.15, smoothing=0.5,
+                 cache_size=50000):
+        self.n = n
+        self.max_chars = max_chars
+        self.min_grams = min_grams
+        self.min_margin = min_margin
+        self.cache_size = cache_size
+        self.languages = list(profiles)
+
+        counts = [Counter(gram for word in words for gram in self.word_grams(word)) for words in profiles.values()]
+        vocabulary = set().union(*counts)
+        totals = [sum(grams.values()) + smoothing * len(vocabulary) for grams in counts]
+        #Log-probability of each trigram under every language; trigrams no profile contains are skipped
+        self.table = {
+            gram: tuple(math.log((grams.get(gram, 0) + smoothing) / total) for grams, total in zip(counts, totals))
+            for gram in vocabulary
+        }
+        #Review words repeat a lot, so the summed row of each word is kept: word -> (score per language..., grams)
+        self.word_rows = {}
+
+    @classmethod
+    def from_data_dir(cls, data_dir, default_language=DEFAULT_LANGUAGE, **options):
+        return cls(
+            {language: read_profile(path) for language, path in language_dirs(data_dir, default_language).items()},
+            **options
+        )
+
+    #Trigrams of a word padded with spaces, so word starts and endings count
+    def word_grams(self, word):
+        n = self.n
+        grams = []
+        for part in WORD.findall(word.lower()):
+            part = f' {part} '
+            grams.extend(part[i:i + n] for i in range(len(part) - n + 1))
+        return grams
+
+    def word_row(self, word):
+        row = self.word_rows.get(word)
+        if row is None:
+            rows = [self.table[gram] for gram in self.word_grams(word) if gram in self.table]
+            row = tuple(map(sum, zip(*rows))) + (len(rows),) if rows else (0.0,) * len(self.languages) + (0,)
+            if len(self.word_rows) >= self.cache_size:
+                self.word_rows.clear()
+            self.word_rows[word] = row
+        return row
+
+    def scores(self, text):
+        words = WORD.findall(text[:self.max_chars].lower())
+        rows = list(map(self.word_rows.get, words))
+        if None in rows:
+            rows = [row or self.word_row(word) for row, word in zip(rows, words)]
+        if not rows:
+            return {}, 0
+        *scores, gram_count = map(sum, zip(*rows))
+        if not gram_count:
+            return {}, 0
+        return dict(zip(self.languages, scores)), gram_count
+
+    #Best language, or default when the text is too short or no language clearly wins
+    def detect(self, text, default=None):
+        scores, gram_count = self.scores(text)
+        if not scores:
+            return default
+        best = max(scores, key=scores.get)
+        if default is None or len(scores) < 2:
+            return best
+        if gram_count < self.min_grams:
+            return default
+
+        second = max(score for language, score in scores.items() if language != best)
+        if (scores[best] - second) / gram_count < self.min_margin:
+            return default
+        return best
+
+
+#Per-language analyzers, loaded on first use; beyond max_loaded the least recently used one is dropped
+class LexiconShards:
+    def __init__(self, data_dir='utilities/sentiment_data', default_language=DEFAULT_LANGUAGE,
+                 max_loaded=3, aspect_window=3, collector=None):
+        self.data_dir = data_dir
+        self.default_language = default_language
+        self.max_loaded = max(1, max_loaded)
+        self.aspect_window = aspect_window
+        #Unknown words are only counted for the default language, LexiconCandidate has no language
+        self.collector = collector
+        self.dirs = language_dirs(data_dir, default_language)
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def languages(self):
+        return list(self.dirs)
+
+    def get(self, language):
+        if language not in self.dirs:
+            language = self.default_language
+
+        with self.lock:
+            analyzer = self.loaded.get(language)
+            if analyzer is not None:
+                self.loaded.move_to_end(language)
+                return analyzer
+
+        # Loaded outside the lock; if two threads race, one copy is dropped
+        analyzer = SentimentAnalyzer(
+            data_dir=self.dirs[language], aspect_window=self.aspect_window,
+            collector=self.collector if language == self.default_language else None,
+        )
+        with self.lock:
+            analyzer = self.loaded.setdefault(language, analyzer)
+            self.loaded.move_to_end(language)
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+        return analyzer
+
+
+#Shards and detector shared by every analyzer of the process with the same options
+def shared_shards(data_dir, default_language=DEFAULT_LANGUAGE, max_loaded=3, aspect_window=3, collector=None):
+    key = (data_dir, default_language, max_loaded, aspect_window, collector)
+    with _shared_lock:
+        if key not in _shared_shards:
+            _shared_shards[key] = (
+                LexiconShards(data_dir, default_language, max_loaded, aspect_window, collector),
+                LanguageDetector.from_data_dir(data_dir, default_language),
+            )
+        return _shared_shards[key]
+
+
+#SentimentAnalyzer that scores each review (route='review') or each run of same-language sentences
+#(route='sentence') with the lexicon of its detected language. In sentence mode the inherited
+#iter_analysis and summaries go through analyze_sentiment, so every sentence is routed. The inherited
+#lexicon attributes (positive_words, vocabulary, lemmatizer, ...) are the default language's.
+class MultilingualAnalyzer(SentimentAnalyzer):
+    def __init__(self, data_dir="utilities/sentiment_data", aspect_window=3, collector=None,
+                 route='review', default_language=DEFAULT_LANGUAGE, max_loaded=3):
+        if route not in ROUTES:
+            raise ValueError(f"Unsupported route: {route}")
+        super().__init__(data_dir=data_dir, aspect_window=aspect_window, collector=collector)
+        self.route = route
+        self.default_language = default_language
+        self.max_loaded = max_loaded
+        self.shards, self.detector = shared_shards(data_dir, default_language, max_loaded, aspect_window, collector)
+
+    @property
+    def worker_options(self):
+        return {
+            'data_dir': self.data_dir, 'aspect_window': self.aspect_window, 'route': self.route,
+            'default_language': self.default_language, 'max_loaded': self.max_loaded,
+        }
+
+    #default: language for inconclusive text, None to take the best guess
+    def detect_language(self, text, default=None):
+        return self.detector.detect(text, default) or self.default_language
+
+    def shard(self, language):
+        return self.shards.get(language)
+
+    #Review mode: the whole analysis, summary included, uses the lexicon of the review's language
+    def iter_analysis(self, text):
+        if self.route == 'review':
+            return self.shard(self.detect_language(text, self.default_language)).iter_analysis(text)
+        return super().iter_analysis(text)
+
+    def analyze_sentiment(self, text, collect_unknown=False):
+        if self.route == 'review':
+            return self.shard(self.detect_language(text, self.default_language)).analyze_sentiment(text, collect_unknown)
+
+        runs = []
+        for sentence in SENTENCE_BREAK.split(text.strip()):
+            # Short sentences ("Great!") carry too few trigrams and stay in the current language
+            language = self.detect_language(sentence, runs[-1][0] if runs else None)
+            if runs and runs[-1][0] == language:
+                runs[-1][1].append(sentence)
+            else:
+                runs.append((language, [sentence]))
+
+        if len(runs) == 1:
+            return self.shard(runs[0][0]).analyze_sentiment(text, collect_unknown)
+        return self.merge([
+            self.shard(language).analyze_sentiment(' '.join(sentences), collect_unknown)[2]
+            for language, sentences in runs
+        ])
+
+    #One result for consecutive runs scored separately; positions continue across runs
+    def merge(self, results):
+        hits = WordHits()
+        aspects = {}
+        total_words = 0
+        for result in results:
+            hits.extend(result.hits, total_words)
+            total_words += result.total_words
+            values = result.aspect_scores
+            for i in range(0, len(values), 3):
+                aspect = aspects.setdefault(values[i], [0.0, 0])
+                aspect[0] += values[i + 1]
+                aspect[1] += values[i + 2]
+
+        sentiment, score = self.overall_sentiment(
+            hits.total_intensity(POSITIVE), hits.total_intensity(NEGATIVE),
+            hits.count(POSITIVE) + hits.count(NEGATIVE)
+        )
+        result = SentimentResult(
+            sentiment, score, total_words, hits,
+            tuple(value for aspect, (aspect_score, mentions) in aspects.items()
+                  for value in (aspect, aspect_score, mentions))
+        )
+        return sentiment, score, result
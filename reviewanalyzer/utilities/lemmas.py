@@ -0,0 +1,107 @@
+import os
+import threading
+import weakref
+from functools import lru_cache, partial
+
+SUFFIX_FILE = 'suffixes.txt'
+LEMMA_CACHE_SIZE = 100000
+MIN_STEM = 3
+#Shorter lexicon words ("bad", "fit") only match exactly; their stripped look-alikes are mostly other words
+MIN_LEMMA = 4
+#Shared stems shorter than this join unrelated words ("kill" -> "killer", "prop" -> "proper")
+MIN_SHARED_STEM = 5
+
+#Held by the analyzers using them, so an analyzer dropped by LexiconShards frees its lemmatizer too
+_shared = weakref.WeakValueDictionary()
+_shared_lock = threading.Lock()
+
+
+#Rules from suffixes.txt: "suffix replacement ..." per line ('-' = nothing), "!word" never normalizes word
+def load_suffix_rules(data_dir):
+    rules = []
+    exceptions = set()
+    path = os.path.join(data_dir, SUFFIX_FILE)
+    if not os.path.exists(path):
+        return (), frozenset()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip().lower()
+            if not line:
+                continue
+            if line.startswith('!'):
+                exceptions.add(line[1:])
+                continue
+            suffix, *replacements = line.split()
+            rules.append((suffix, tuple('' if r == '-' else r for r in replacements) or ('',)))
+
+    #Longest suffix first, so "ies" is tried before "s"
+    rules.sort(key=lambda rule: -len(rule[0]))
+    return tuple(rules), frozenset(exceptions)
+
+
+#Maps tokens to the lexicon word they stand for, or None for tokens that match no lexicon word.
+#Every vocabulary word matches itself; only targets (sentiment and aspect words) are reached by stripping,
+#so "notes" never becomes the negation "not".
+class Lemmatizer:
+    def __init__(self, vocabulary, targets, rules, exceptions=frozenset(), cache_size=LEMMA_CACHE_SIZE):
+        self.rules = rules
+        self.exceptions = exceptions
+
+        self.vocabulary = frozenset(vocabulary)
+        self.targets = frozenset(word for word in targets if len(word) >= MIN_LEMMA)
+        #Stems of target words, each to the first word (sorted) that has it: "disappoint" -> "disappointed"
+        self.stem_index = {}
+        for word in sorted(self.targets):
+            for stem in self.stems(word):
+                if len(stem) >= MIN_SHARED_STEM:
+                    self.stem_index.setdefault(stem, word)
+
+        #Paid once per distinct token, bounded so a stream of typos cannot grow it without limit.
+        #Through a weak proxy, so the cache does not keep its lemmatizer alive in a reference cycle.
+        self.lemma = lru_cache(maxsize=cache_size)(partial(Lemmatizer.find_lemma, weakref.proxy(self)))
+
+    def stems(self, word):
+        if word in self.exceptions:
+            return
+        for suffix, replacements in self.rules:
+            if not word.endswith(suffix) or len(word) - len(suffix) < MIN_STEM:
+                continue
+            stem = word[:-len(suffix)]
+            for replacement in replacements:
+                yield stem + replacement
+            # "stopped" -> "stopp" -> "stop"
+            if len(stem) > MIN_STEM and stem[-1] == stem[-2] and stem[-1] not in 'aeiouls':
+                yield stem[:-1]
+
+    #The token itself if it is a lexicon word, else a stripped form that is one ("loving" -> "love"),
+    #else a lexicon word with the same stem ("disappointments" -> "disappointed"), else None
+    def find_lemma(self, token):
+        if token in self.vocabulary:
+            return token
+        stems = list(self.stems(token))
+        for stem in stems:
+            if stem in self.targets:
+                return stem
+        for stem in stems:
+            lemma = self.stem_index.get(stem)
+            if lemma is not None:
+                return lemma
+        return None
+
+    def cache_info(self):
+        return self.lemma.cache_info()
+
+
+#One lemmatizer (and cache) per lexicon per process while any analyzer uses it, however many are created
+def shared_lemmatizer(data_dir, vocabulary, targets):
+    rules, exceptions = load_suffix_rules(data_dir)
+    if not rules:
+        return None
+
+    key = (os.path.abspath(data_dir), frozenset(vocabulary), frozenset(targets), rules, exceptions)
+    with _shared_lock:
+        lemmatizer = _shared.get(key)
+        if lemmatizer is None:
+            lemmatizer = _shared[key] = Lemmatizer(key[1], key[2], rules, exceptions)
+        return lemmatizer
@@ -0,0 +1,163 @@
+import sys
+from array import array
+
+POSITIVE = 0
+NEGATIVE = 1
+NEUTRAL = 2
+INTENSIFIER = 3
+NEGATION = 4
+KIND_MASK = 7
+#Flags: the word followed a negation / an intensifier
+NEGATED = 8
+INTENSIFIED = 16
+
+SCORED_KINDS = {
+    'positive_words': POSITIVE,
+    'negative_words': NEGATIVE,
+    'neutral_words': NEUTRAL,
+}
+
+
+#Every lexicon hit of one text: interned words plus one packed code per hit (position << 8 | flags | kind)
+class WordHits:
+    __slots__ = ('words', 'codes')
+
+    def __init__(self):
+        self.words = []
+        self.codes = array('Q')
+
+    def add(self, kind, word, position, intensified=False, negated=False):
+        self.words.append(sys.intern(word))
+        self.codes.append(position << 8 | (INTENSIFIED if intensified else 0) | (NEGATED if negated else 0) | kind)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def count(self, kind):
+        return sum(1 for code in self.codes if code & KIND_MASK == kind)
+
+    def has(self, kind):
+        return any(code & KIND_MASK == kind for code in self.codes)
+
+    #Same values analyze_sentiment used to store per word
+    @staticmethod
+    def intensity(code):
+        return 2.0 if code & INTENSIFIED else 1.0
+
+    @classmethod
+    def contributed_score(cls, code):
+        kind = code & KIND_MASK
+        if kind == NEUTRAL:
+            return 0
+        if kind == NEGATIVE and not code & NEGATED:
+            return -cls.intensity(code)
+        return cls.intensity(code)
+
+    #Summed intensity of one kind, e.g. the positive score of the text
+    def total_intensity(self, kind):
+        return sum(self.intensity(code) for code in self.codes if code & KIND_MASK == kind)
+
+    #Append the hits of a following text whose tokens start at token_offset
+    def extend(self, other, token_offset):
+        self.words.extend(other.words)
+        shift = token_offset << 8
+        self.codes.extend(code + shift for code in other.codes)
+
+    def hits(self, kind):
+        return [(word, code) for word, code in zip(self.words, self.codes) if code & KIND_MASK == kind]
+
+    #The per-word dicts of the original word_details shape
+    def scored_dicts(self, kind):
+        return [
+            {
+                'word': word,
+                'position': code >> 8,
+                'negated': bool(code & NEGATED),
+                'intensity': self.intensity(code),
+                'contributed_score': self.contributed_score(code),
+            }
+            for word, code in self.hits(kind)
+        ]
+
+    def to_dict(self):
+        details = {key: self.scored_dicts(kind) for key, kind in SCORED_KINDS.items()}
+        details['intensifiers'] = [
+            {'word': word, 'position': code >> 8, 'multiplier': self.intensity(code)}
+            for word, code in self.hits(INTENSIFIER)
+        ]
+        details['negations'] = [
+            {'word': word, 'position': code >> 8, 'active': True}
+            for word, code in self.hits(NEGATION)
+        ]
+        return details
+
+
+#Result of SentimentAnalyzer.analyze_sentiment; to_dict() gives the nested dict for templates and JSON
+class SentimentResult:
+    __slots__ = ('sentiment', 'score', 'total_words', 'hits', 'aspect_scores')
+
+    def __init__(self, sentiment, score, total_words, hits, aspect_scores=()):
+        self.sentiment = sentiment
+        self.score = score
+        self.total_words = total_words
+        self.hits = hits
+        #Flat (aspect, score, mentions, aspect, score, mentions, ...)
+        self.aspect_scores = aspect_scores
+
+    @property
+    def word_counts(self):
+        return {
+            'total': self.total_words,
+            'positive': self.hits.count(POSITIVE),
+            'negative': self.hits.count(NEGATIVE),
+            'neutral': self.hits.count(NEUTRAL),
+            'intensifiers': self.hits.count(INTENSIFIER),
+            'negations': self.hits.count(NEGATION),
+        }
+
+    @property
+    def percentages(self):
+        counts = self.word_counts
+        total = self.total_words
+        return {
+            kind: round(counts[kind] / total * 100, 2) if total > 0 else 0
+            for kind in ('positive', 'negative', 'neutral')
+        }
+
+    @property
+    def has_strong_words(self):
+        return self.hits.has(POSITIVE) or self.hits.has(NEGATIVE)
+
+    @property
+    def aspects(self):
+        values = self.aspect_scores
+        return {
+            values[i]: {'score': round(values[i + 1], 4), 'mentions': values[i + 2]}
+            for i in range(0, len(values), 3)
+        }
+
+    def to_dict(self):
+        return {
+            'sentiment': self.sentiment,
+            'score': self.score,
+            'percentages': self.percentages,
+            'word_counts': self.word_counts,
+            'word_details': self.hits.to_dict(),
+            'aspects': self.aspects,
+        }
+
+
+#Per-sentence scores used to pick representative sentences for the summary
+class SentenceScore:
+    __slots__ = ('sentence', 'sentiment', 'score', 'word_count', 'has_strong_words')
+
+    def __init__(self, sentence, sentiment, score, word_count, has_strong_words):
+        self.sentence = sentence
+        self.sentiment = sentiment
+        self.score = score
+        self.word_count = word_count
+        self.has_strong_words = has_strong_words
+
+    @property
+    def sentiment_strength(self):
+        return abs(self.score)
@@ -1,23 +1,57 @@
 import re
 import os
+import sys
 import math
-from collections import defaultdict
+from collections import defaultdict, deque
+
+from .corpus import score_file_chunks
+from .lemmas import shared_lemmatizer
+from .results import INTENSIFIER, NEGATION, NEGATIVE, NEUTRAL, POSITIVE, SentenceScore, SentimentResult, WordHits
+
+SECTIONS = ('positive', 'negative', 'neutral')
+#Aspect windows end at these; the token count between them matches tokenize() after preprocess_text()
+CLAUSE_BREAK = re.compile(r"[.!?;]+")
+WORD = re.compile(r"\w+")
 
 class SentimentAnalyzer:
-    def __init__(self, data_dir="utilities/sentiment_data"):
+    def __init__(self, data_dir="utilities/sentiment_data", aspect_window=3, collector=None, normalize=True):
         self.data_dir = data_dir
+        self.aspect_window = aspect_window
+        #Optional UnknownWordCollector (utilities.word_stats) fed with tokens outside the lexicon
+        self.collector = collector
+        self.normalize = normalize
         self.positive_words = set()
         self.negative_words = set()
         self.neutral_words = set()
         self.intensifiers = set()
         self.negations = set()
+        self.aspects = set()
         self.load_datasets()
+        #Inflected forms are looked up by their lexicon lemma when data_dir has suffixes.txt (utilities.lemmas)
+        self.lemmatizer = shared_lemmatizer(data_dir, self.vocabulary, self.lemma_targets) if normalize else None
+    
+    #Constructor options for score_file_chunks workers to build the same analyzer (the collector stays here)
+    @property
+    def worker_options(self):
+        return {'data_dir': self.data_dir, 'aspect_window': self.aspect_window, 'normalize': self.normalize}
+    
+    @property
+    def vocabulary(self):
+        return (self.positive_words | self.negative_words | self.neutral_words
+                | self.intensifiers | self.negations | self.aspects)
+    
+    #Words an inflected token may be normalized to; negations and intensifiers change how the
+    #following words score, so they only ever match exactly
+    @property
+    def lemma_targets(self):
+        return (self.positive_words | self.negative_words | self.aspects) - self.negations - self.intensifiers
     
     #Load all sentiment data and intensifiers    
     def load_datasets(self):
         try:
             self.load_sentiment_words()
             self.load_modifiers()
+            self.load_aspects()
         except Exception as e:
             self.load_fallback_words()
     
@@ -54,6 +88,15 @@ class SentimentAnalyzer:
                 raise FileNotFoundError(f"Modifier file {filename} not found")
     
     
+    def load_aspects(self):
+        filepath = os.path.join(self.data_dir, 'aspects.txt')
+        if os.path.exists(filepath):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                self.aspects = set(line.strip().lower() for line in f if line.strip())
+        else:
+            raise FileNotFoundError("Aspect file aspects.txt not found")
+    
+    
     def load_fallback_words(self):
         
         #Positive words
@@ -131,6 +174,13 @@ class SentimentAnalyzer:
             'totally', 'utterly', 'highly', 'particularly', 'especially'
         }
         
+        #Aspects
+        self.aspects = {
+            'battery', 'delivery', 'shipping', 'packaging', 'quality', 'support',
+            'service', 'price', 'value', 'design', 'screen', 'display', 'camera',
+            'sound', 'performance', 'speed', 'software', 'features', 'size', 'comfort'
+        }
+        
         #Negations
         self.negations = {
             'not', "n't", 'no', 'never', 'none', 'nothing', 'without',
@@ -160,206 +210,230 @@ class SentimentAnalyzer:
     def tokenize(self, text):
         return re.findall(r'\b\w+\b', text)
     
+    #Token positions where a new sentence or clause starts. Preprocessing turns "n't", "'s", ... into
+    #" not", " is", ..., which keeps the number of word runs, so they are counted on the raw text.
+    def clause_starts(self, text, token_count):
+        starts = []
+        position = 0
+        for clause in CLAUSE_BREAK.split(text.lower()):
+            position += len(WORD.findall(clause))
+            if not starts or starts[-1] != position:
+                starts.append(position)
+        if position != token_count:
+            return []
+        return starts[:-1]
+    
     
     #Sentiment Analysis Algorithm
-    def analyze_sentiment(self, text):
+    def analyze_sentiment(self, text, collect_unknown=False):
         
         processed_text = self.preprocess_text(text)
         tokens = self.tokenize(processed_text)
+        #Lexicon lookups use lemmas, cached per distinct token; None marks a token outside the lexicon,
+        #which skips the set lookups below. Hits and the collector keep the original tokens.
+        words = list(map(self.lemmatizer.lemma, tokens)) if self.lemmatizer is not None else tokens
         
         positive_score = 0
         negative_score = 0
+        positive_count = 0
+        negative_count = 0
         intensity = 1.0
         negation_active = False
         
-        found_positive = []
-        found_negative = []
-        found_neutral = []
-        found_intensifiers = []
-        found_negations = []
-        
-        for i, token in enumerate(tokens):
-            word_info = {
-                'word': token,
-                'position': i,
-                'negated': negation_active,
-                'intensity': intensity
-            }
+        #Lexicon hits packed into a typed array, see utilities.results
+        hits = WordHits()
+        
+        #Aspect terms and sentiment hits from the last aspect_window tokens of the same clause
+        aspect_scores = {}
+        recent_aspects = deque()
+        recent_hits = deque()
+        clause_starts = iter(self.clause_starts(text, len(tokens)))
+        next_clause = next(clause_starts, -1)
+        
+        unknown = [] if collect_unknown and self.collector is not None else None
+        
+        for i, token in enumerate(words):
+            if i == next_clause:
+                recent_aspects.clear()
+                recent_hits.clear()
+                next_clause = next(clause_starts, -1)
+            
+            if token is None:
+                negation_active = False
+                intensity = 1.0
+                if unknown is not None:
+                    unknown.append(i)
+                continue
             
+            if token in self.aspects:
+                while recent_hits and recent_hits[0][0] < i - self.aspect_window:
+                    recent_hits.popleft()
+                aspect = aspect_scores.setdefault(token, [0.0, 0])
+                aspect[1] += 1
+                for _, hit_score in recent_hits:
+                    aspect[0] += hit_score
+                recent_aspects.append((i, token))
+                # Aspect words that are also lexicon words ("quality", "support") still score below
+
             if token in self.intensifiers:
                 intensity = 2.0
-                found_intensifiers.append({
-                    'word': token,
-                    'position': i,
-                    'multiplier': intensity
-                })
+                hits.add(INTENSIFIER, tokens[i], i, True, negation_active)
                 continue
             
             if token in self.negations:
+                hits.add(NEGATION, tokens[i], i, intensity != 1.0, negation_active)
                 negation_active = True
-                found_negations.append({
-                    'word': token,
-                    'position': i,
-                    'active': True
-                })
                 continue
             
             if token in self.positive_words:
-                score = intensity
+                self.attribute_to_aspects(i, -intensity if negation_active else intensity,
+                                          recent_aspects, recent_hits, aspect_scores)
                 if negation_active:
-                    score = -score
-                    negative_score += abs(score)
-                    word_info['contributed_score'] = -score
-                    found_negative.append(word_info)
+                    negative_score += intensity
+                    negative_count += 1
+                    hits.add(NEGATIVE, tokens[i], i, intensity != 1.0, True)
                 else:
-                    positive_score += score
-                    word_info['contributed_score'] = score
-                    found_positive.append(word_info)
+                    positive_score += intensity
+                    positive_count += 1
+                    hits.add(POSITIVE, tokens[i], i, intensity != 1.0)
                 
                 negation_active = False
                 intensity = 1.0
             
             elif token in self.negative_words:
-                score = intensity
+                self.attribute_to_aspects(i, intensity if negation_active else -intensity,
+                                          recent_aspects, recent_hits, aspect_scores)
                 if negation_active:
-                    score = -score
-                    positive_score += abs(score)
-                    word_info['contributed_score'] = abs(score)
-                    found_positive.append(word_info)
+                    positive_score += intensity
+                    positive_count += 1
+                    hits.add(POSITIVE, tokens[i], i, intensity != 1.0, True)
                 else:
-                    negative_score += score
-                    word_info['contributed_score'] = -score
-                    found_negative.append(word_info)
+                    negative_score += intensity
+                    negative_count += 1
+                    hits.add(NEGATIVE, tokens[i], i, intensity != 1.0)
                     
                 negation_active = False
                 intensity = 1.0
             
             elif token in self.neutral_words:
-                word_info['contributed_score'] = 0
-                found_neutral.append(word_info)
+                hits.add(NEUTRAL, tokens[i], i, intensity != 1.0, negation_active)
             
             else:
                 negation_active = False
                 intensity = 1.0
-                
-        total_sentiment_words = len(found_positive) + len(found_negative)
+                if unknown is not None:
+                    unknown.append(i)
         
+        if unknown is not None:
+            self.collector.record(tokens, unknown)
+                
+        overall_sentiment, normalized_score = self.overall_sentiment(
+            positive_score, negative_score, positive_count + negative_count
+        )
+        
+        result = SentimentResult(
+            overall_sentiment,
+            normalized_score,
+            len(tokens),
+            hits,
+            tuple(value for aspect, (score, mentions) in aspect_scores.items()
+                  for value in (sys.intern(aspect), score, mentions))
+        )
+        
+        return overall_sentiment, normalized_score, result
+    
+    #Label and rounded score from the summed hit intensities
+    @staticmethod
+    def overall_sentiment(positive_score, negative_score, total_sentiment_words):
         if total_sentiment_words == 0:
-            overall_sentiment = 'neutral'
-            normalized_score = 0.0
+            return 'neutral', 0.0
+        
+        raw_score = positive_score - negative_score
+        normalized_score = max(-1.0, min(1.0, raw_score/total_sentiment_words))
+        
+        if normalized_score > 0.1:
+            overall_sentiment = 'positive'
+        elif normalized_score < -0.1:
+            overall_sentiment = 'negative'
         else:
-            raw_score = positive_score - negative_score
-            normalized_score = max(-1.0, min(1.0, raw_score/total_sentiment_words))
-            
-            if normalized_score > 0.1:
-                overall_sentiment = 'positive'
-            elif normalized_score < -0.1:
-                overall_sentiment = 'negative'
-            else:
-                overall_sentiment = 'neutral'
-        
-        total_words = len(tokens)
-        positive_percent = (len(found_positive) / total_words * 100) if total_words > 0 else 0
-        negative_percent = (len(found_negative) / total_words * 100) if total_words > 0 else 0
-        neutral_percent = (len(found_neutral) / total_words * 100) if total_words > 0 else 0
-        
-        detailed_analysis = {
-            'sentiment': overall_sentiment,
-            'score': round(normalized_score, 4),
-            'percentages': {
-                'positive': round(positive_percent, 2),
-                'negative': round(negative_percent, 2),
-                'neutral': round(neutral_percent, 2)
-            },
-            'word_counts': {
-                'total': total_words,
-                'positive': len(found_positive),
-                'negative': len(found_negative),
-                'neutral': len(found_neutral),
-                'intensifiers': len(found_intensifiers),
-                'negations': len(found_negations)
-            },
-            'word_details': {
-                'positive_words': found_positive,
-                'negative_words': found_negative,
-                'neutral_words': found_neutral,
-                'intensifiers': found_intensifiers,
-                'negations': found_negations
-            },
-            'processed_text': processed_text
-        }
+            overall_sentiment = 'neutral'
         
-        return overall_sentiment, round(normalized_score, 4), detailed_analysis
+        return overall_sentiment, round(normalized_score, 4)
+    
+
+    #Credit a sentiment hit to aspects seen just before it, and keep it for aspects that follow.
+    #An aspect that is also a lexicon word ("quality", "support") does not score its own hit.
+    def attribute_to_aspects(self, position, hit_score, recent_aspects, recent_hits, aspect_scores):
+        while recent_aspects and recent_aspects[0][0] < position - self.aspect_window:
+            recent_aspects.popleft()
+        for aspect in {aspect for aspect_position, aspect in recent_aspects if aspect_position != position}:
+            aspect_scores[aspect][0] += hit_score
+        
+        while recent_hits and recent_hits[0][0] < position - self.aspect_window:
+            recent_hits.popleft()
+        recent_hits.append((position, hit_score))
     
 
     #Summarization Algorithm
     def summarizer(self, text, sentences_per_section = 5):
+        return dict(self.iter_summary(text, sentences_per_section))
+    
+    #Yields (section, sentences) for positive, negative and neutral, each as soon as it is selected
+    def iter_summary(self, text, sentences_per_section = 5):
         if not text or not text.strip():
-            return {
-                'positive': [],
-                'negative': [],
-                'neutral': []
-            }
+            for section in SECTIONS:
+                yield section, []
+            return
         sentences = self.split_into_sentences(text)
         if len(sentences) <= sentences_per_section * 3:
-            return self.categorize(sentences)
+            yield from self.categorize(sentences).items()
+            return
         
-        sentence_analysis = []
+        sentence_analysis = {section: [] for section in SECTIONS}
         for sentence in sentences:
-            sentiment, score, details = self.analyze_sentiment(sentence)
-            sentence_analysis.append({
-                'sentence': sentence,
-                'sentiment': sentiment,
-                'score': score,
-                'word_count': len(self.tokenize(self.preprocess_text(sentence))),
-                'sentiment_strength': abs(score),
-                'has_strong_words': (len(details['word_details']['positive_words']) > 0
-                                     or len(details['word_details']['negative_words']) > 0)
-            })
-        
-        positive_sentences = [s for s in sentence_analysis if s['sentiment'] == 'positive']
-        negative_sentences = [s for s in sentence_analysis if s['sentiment'] == 'negative']
-        neutral_sentences = [s for s in sentence_analysis if s['sentiment'] == 'neutral']
-        
-        summary = {
-            'positive': self.select_representative(positive_sentences, sentences_per_section),
-            'negative': self.select_representative(negative_sentences, sentences_per_section),
-            'neutral': self.select_representative(neutral_sentences, sentences_per_section)
-        }
-        
-        return summary
+            sentiment, score, result = self.analyze_sentiment(sentence)
+            sentence_analysis[sentiment].append(SentenceScore(
+                sentence,
+                sentiment,
+                score,
+                result.total_words,
+                result.has_strong_words
+            ))
+        
+        for section in SECTIONS:
+            yield section, self.select_representative(sentence_analysis[section], sentences_per_section)
     
     def select_representative(self, sentences, max_sentences):
         if not sentences:
             return []
         
         if len(sentences) <= max_sentences:
-            return [s['sentence'] for s in sentences]
+            return [s.sentence for s in sentences]
         
         scored_sentences = []
         
         for s in sentences:
-            sentiment_score = s['sentiment_strength'] * 0.5
+            sentiment_score = s.sentiment_strength * 0.5
             length_score = 0.0
-            if 8 <= s['word_count'] <= 25:
+            if 8 <= s.word_count <= 25:
                 length_score = 0.3
-            elif 5 <= s['word_count'] <= 30:
+            elif 5 <= s.word_count <= 30:
                 length_score = 0.2
             else: 
                 length_score = 0.1
                 
-            strong_words_score = 0.2 if s['has_strong_words'] else 0.0
+            strong_words_score = 0.2 if s.has_strong_words else 0.0
             
             total_score = sentiment_score + length_score + strong_words_score
             scored_sentences.append((s, total_score))
         
         scored_sentences.sort(key=lambda x: x[1], reverse=True)
-        selected = [s[0]['sentence'] for s in scored_sentences[:max_sentences]]
+        selected = [s[0].sentence for s in scored_sentences[:max_sentences]]
         
         return selected
     
     def categorize(self, sentences):
-        summary = {'positive': [], 'negative': [], 'neutral': []}
+        summary = {section: [] for section in SECTIONS}
         
         for sentence in sentences:
             sentiment, score, _ = self.analyze_sentiment(sentence)
@@ -387,33 +461,55 @@ class SentimentAnalyzer:
         
         return sentences
     
-    def comprehensive_analysis(self, text):
-        sentiment, score, details = self.analyze_sentiment(text)
-        sentiment_summary = self.summarizer(text, sentences_per_section=3)
+    #Score a corpus on disk record by record through mmap, in parallel by byte range (utilities.corpus)
+    def analyze_file(self, path, record_format='lines', workers=None, **options):
+        chunks = score_file_chunks(path, record_format, workers, analyzer=self, **options)
+        for results, _ in chunks:
+            yield from results
+    
+    #Progressive analysis, yields (section, data) as soon as each part is computed.
+    #Result objects are turned into plain dicts here, for templates, JSON and the database.
+    def iter_analysis(self, text):
+        sentiment, score, result = self.analyze_sentiment(text, collect_unknown=True)
+        
+        yield 'overview', {
+            'sentiment': sentiment,
+            'score': score
+        }
+        yield 'metrics', {
+            'percentages': result.percentages,
+            'word_counts': result.word_counts,
+            'total_words': result.total_words
+        }
+        yield 'aspects', result.aspects
+        yield 'word_analysis', result.hits.to_dict()
         
-
-        total_sentences = sum(len(sentences) for sentences in sentiment_summary.values())
+        # Sentence scoring is the slow part; each section goes out once it is selected
+        distribution = {}
+        for section, sentences in self.iter_summary(text, sentences_per_section=3):
+            distribution[section] = len(sentences)
+            yield f'summary_{section}', sentences
         
-        sentiment_distribution = {
-            'positive': len(sentiment_summary['positive']),
-            'negative': len(sentiment_summary['negative']),
-            'neutral': len(sentiment_summary['neutral']),
-            'total': total_sentences
-        }
+        distribution['total'] = sum(distribution.values())
+        yield 'distribution', distribution
+    
+    def comprehensive_analysis(self, text):
+        sections = dict(self.iter_analysis(text))
            
         comprehensive_analysis = {
             'overview': {
-                'sentiment': sentiment,
-                'score': score,
-                'sentiment_distribution': sentiment_distribution
+                'sentiment': sections['overview']['sentiment'],
+                'score': sections['overview']['score'],
+                'sentiment_distribution': sections['distribution']
             },
-            'summary_by_sentiment': sentiment_summary,
-            'detailed_metrics': {
-                'percentages': details['percentages'],
-                'word_counts': details['word_counts'],
-                'total_words': details['word_counts']['total']
+            'summary_by_sentiment': {
+                'positive': sections['summary_positive'],
+                'negative': sections['summary_negative'],
+                'neutral': sections['summary_neutral']
             },
-            'word_analysis': details['word_details']
+            'detailed_metrics': sections['metrics'],
+            'aspect_analysis': sections['aspects'],
+            'word_analysis': sections['word_analysis']
         }
         
         return comprehensive_analysis
@@ -0,0 +1,180 @@
+import threading
+import time
+from array import array
+from collections import Counter, deque
+
+#Frequent function words that are never lexicon candidates
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'but', 'if', 'so', 'as', 'of', 'at', 'by', 'for', 'from', 'in',
+    'into', 'on', 'onto', 'to', 'up', 'with', 'about', 'over', 'than', 'then', 'too', 'also',
+    'i', 'me', 'my', 'we', 'our', 'you', 'your', 'he', 'him', 'his', 'she', 'her', 'it', 'its',
+    'they', 'them', 'their', 'this', 'that', 'these', 'those', 'there', 'here', 'what', 'which',
+    'who', 'when', 'where', 'why', 'how', 'is', 'am', 'are', 'was', 'were', 'be', 'been', 'being',
+    'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'can', 'could', 'should', 'may',
+    'might', 'must', 'shall', 'just', 'only', 'all', 'any', 'some', 'one', 'out', 'after', 'before',
+}
+
+
+#Fixed-size frequency estimates: depth rows of width counters, estimates never undercount
+class CountMinSketch:
+    def __init__(self, width=2 ** 14, depth=4):
+        self.width = width
+        self.depth = depth
+        self.clear()
+
+    def add(self, item, count=1):
+        estimate = None
+        for seed, row in enumerate(self.rows):
+            index = hash((seed, item)) % self.width
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def estimate(self, item):
+        return min(row[hash((seed, item)) % self.width] for seed, row in enumerate(self.rows))
+
+    def clear(self):
+        self.rows = [array('I', bytes(4 * self.width)) for _ in range(self.depth)]
+
+
+#The k items with the highest sketch estimates seen so far
+class HeavyHitters:
+    def __init__(self, k=500):
+        self.k = k
+        self.counts = {}
+        self.floor = 0
+
+    def offer(self, item, estimate):
+        if item in self.counts:
+            self.counts[item] = estimate
+        elif len(self.counts) < self.k:
+            self.counts[item] = estimate
+            if len(self.counts) == self.k:
+                self.floor = min(self.counts.values())
+        elif estimate > self.floor:
+            del self.counts[min(self.counts, key=self.counts.get)]
+            self.counts[item] = estimate
+            self.floor = min(self.counts.values())
+
+    def items(self):
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def clear(self):
+        self.counts = {}
+        self.floor = 0
+
+
+#Counts tokens missing from the lexicon, and bigrams of them, across analyses in fixed memory.
+#record() only queues the unknown tokens of a document; a background thread counts them and folds
+#them into the sketch in batches, so scoring is not slowed down. The queue holds at most
+#max_queued_tokens tokens across documents; past that the oldest documents are dropped.
+#on_flush receives [(kind, term, count)] every flush_every analyses or flush_seconds.
+class UnknownWordCollector:
+    def __init__(self, width=2 ** 14, depth=4, top_k=500, flush_every=1000, flush_seconds=300,
+                 on_flush=None, max_queued_tokens=1000000, batch_size=64):
+        self.sketch = CountMinSketch(width, depth)
+        self.top = {'word': HeavyHitters(top_k), 'bigram': HeavyHitters(top_k)}
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.on_flush = on_flush
+        self.batch_size = batch_size
+        self.max_queued_tokens = max_queued_tokens
+        self.queue = deque()
+        self.queued_tokens = 0
+        self.queued_documents = 0
+        self.queue_lock = threading.Lock()
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.worker = None
+
+    @staticmethod
+    def is_candidate(token):
+        return 2 < len(token) <= 100 and token not in STOPWORDS and not token.isdigit()
+
+    #tokens is the whole token list, positions the indexes of tokens that matched no lexicon set.
+    #Only the unknown tokens are kept, not the document's token list.
+    def record(self, tokens, positions):
+        unknown = list(map(tokens.__getitem__, positions))
+
+        with self.queue_lock:
+            self.queued_documents += 1
+            if unknown:
+                self.queue.append((unknown, positions))
+                self.queued_tokens += len(unknown)
+                while self.queued_tokens > self.max_queued_tokens and len(self.queue) > 1:
+                    self.queued_tokens -= len(self.queue.popleft()[0])
+            queued = self.queued_documents
+
+        if self.worker is None:
+            self.start()
+        if queued >= self.batch_size:
+            self.wakeup.set()
+
+    def start(self):
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name='unknown-word-collector', daemon=True)
+                self.worker.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(min(self.flush_seconds, 5))
+            self.wakeup.clear()
+            self.process_queue()
+            if (self.pending >= self.flush_every
+                    or time.monotonic() - self.last_flush >= self.flush_seconds):
+                self.flush()
+
+    #Fold queued documents into the sketch: every occurrence counts, and each distinct term
+    #updates the sketch once per batch with its summed count
+    def process_queue(self):
+        with self.queue_lock:
+            queue, self.queue = self.queue, deque()
+            documents, self.queued_documents = self.queued_documents, 0
+            self.queued_tokens = 0
+        if not documents:
+            return
+
+        words = Counter()
+        bigrams = Counter()
+        for unknown, positions in queue:
+            words.update(unknown)
+            bigrams.update(
+                f"{unknown[i]} {unknown[i + 1]}"
+                for i in range(len(positions) - 1) if positions[i + 1] == positions[i] + 1
+            )
+
+        words = {word: count for word, count in words.items() if self.is_candidate(word)}
+        bigrams = {
+            bigram: count for bigram, count in bigrams.items()
+            if all(word in words for word in bigram.split(' '))
+        }
+
+        with self.lock:
+            for kind, counts in (('word', words), ('bigram', bigrams)):
+                top = self.top[kind]
+                for term, count in counts.items():
+                    top.offer(term, self.sketch.add((kind, term), count))
+            self.pending += documents
+
+    #Hand the current heavy hitters to on_flush and start a new window
+    def flush(self):
+        self.process_queue()
+        with self.lock:
+            candidates = [
+                (kind, term, count)
+                for kind, top in self.top.items()
+                for term, count in top.items()
+            ]
+            self.sketch.clear()
+            for top in self.top.values():
+                top.clear()
+            self.pending = 0
+            self.last_flush = time.monotonic()
+
+        if candidates and self.on_flush:
+            self.on_flush(candidates)
+        return candidates